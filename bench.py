@@ -0,0 +1,262 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from frame_sources import load_video, synthetic_frames
+
+# Конфигурации по наборам: имя -> параметры
+SUITES = {
+    "face": [
+        {"name": "face/detect_every=1", "detect_every": 1, "cache_threshold": -1},
+        {"name": "face/detect_every=1/scale=0.5", "detect_every": 1, "cache_threshold": -1,
+         "detect_scale": 0.5, "baseline": "face/detect_every=1"},
+        {"name": "face/detect_every=10", "detect_every": 10, "cache_threshold": -1},
+        {"name": "face/detect_every=10/scale=0.5", "detect_every": 10, "cache_threshold": -1,
+         "detect_scale": 0.5, "baseline": "face/detect_every=10"},
+        {"name": "face/detect_every=10/cache=6", "detect_every": 10, "cache_threshold": 6},
+    ],
+    "knb": [
+        {"name": "knb/full_frame", "latency_budget_ms": None},
+        {"name": "knb/adaptive_25ms", "latency_budget_ms": 25.0},
+        # Полный путь кадра до картинки для Tkinter: прежний show_video и буферы с одной конвертацией
+        {"name": "knb/display_legacy", "latency_budget_ms": None, "display": "legacy"},
+        {"name": "knb/display_buffers", "latency_budget_ms": None, "display": "buffers",
+         "baseline": "knb/display_legacy"},
+    ],
+    "recognize": [
+        {"name": "recognize/rules"},
+    ],
+}
+
+
+def load_frames(source):
+    if source["video"]:
+        return load_video(source["video"], source["frames"])
+    return synthetic_frames(source["frames"], seed=source["seed"])
+
+
+class _Landmark:
+    __slots__ = ("x", "y", "z")
+
+    def __init__(self, x, y, z):
+        self.x, self.y, self.z = x, y, z
+
+
+def synthetic_landmarks(count, seed=0):
+    """Наборы из 21 точки с атрибутами x, y, z - как у MediaPipe"""
+    rng = np.random.default_rng(seed)
+    return [[_Landmark(*map(float, point)) for point in hand]
+            for hand in rng.random((count, 21, 3))]
+
+
+def build_runner(suite, config):
+    """Функция, обрабатывающая один вход тем же путем, что и приложение, и ее финализатор"""
+    if suite == "face":
+        import face
+        analyzer = face.EmotionAnalyzer(config.get("detector_backend", "opencv"),
+                                        config.get("detect_scale", 1.0))
+        analyzer.warm_up(face.StartupProfiler())
+        threshold = config["cache_threshold"]
+        cache = face.EmotionCache(max_distance=threshold) if threshold >= 0 else None
+        tracked = face.TrackedFaceAnalyzer(analyzer, config["detect_every"], cache=cache)
+        return tracked.analyze, None
+
+    if suite == "knb":
+        import knb
+        recognizer = knb.GestureRecognizer(latency_budget_ms=config["latency_budget_ms"])
+        display = config.get("display")
+
+        if display == "legacy":
+            from PIL import Image
+
+            def analyze(frame):
+                # Как show_video до буферов: отражение, копия, вторая конвертация и ресайз Pillow
+                processed = recognizer.analyze_frame_with_mediapipe(cv2.flip(frame, 1))[0]
+                return Image.fromarray(cv2.cvtColor(processed, cv2.COLOR_BGR2RGB)).resize((500, 380))
+        elif display == "buffers":
+            out = np.empty((380, 500, 3), dtype=np.uint8)
+
+            def analyze(frame):
+                return knb.to_display_image(recognizer.analyze_frame_rgb(frame, mirror=True)[0], out)
+        else:
+            def analyze(frame):
+                return recognizer.analyze_frame_with_mediapipe(cv2.flip(frame, 1))
+        return analyze, recognizer.close
+
+    if suite == "recognize":
+        import knb
+        # Путь recognize_gesture без MediaPipe: точки -> массив (21, 3) -> правила
+        buffer = np.empty((21, 3), dtype=np.float32)
+        return (lambda landmarks: knb.classify_hand(knb.landmarks_to_array(landmarks, buffer))), None
+
+    raise ValueError(f"Неизвестный набор: {suite}")
+
+
+def measure(process, inputs, warmup=5):
+    """Пропускная способность и перцентили задержки на одном проходе по входам"""
+    for item in inputs[:warmup]:
+        process(item)
+
+    latencies = np.empty(len(inputs), dtype=np.float64)
+    started = time.perf_counter()
+    for i, item in enumerate(inputs):
+        item_started = time.perf_counter()
+        process(item)
+        latencies[i] = time.perf_counter() - item_started
+    elapsed = time.perf_counter() - started
+
+    latencies *= 1000
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+    return {
+        "items": len(inputs),
+        "throughput_per_s": round(len(inputs) / elapsed, 2),
+        "mean_ms": round(float(latencies.mean()), 4),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+    }
+
+
+def allocation_peak_kb(process, inputs, items=20):
+    """Средний пик временных выделений на вход по tracemalloc (массивы NumPy и OpenCV;
+    память Pillow и MediaPipe tracemalloc не видит)"""
+    tracemalloc.start()
+    try:
+        peaks = []
+        for item in inputs[:items]:
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            process(item)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+    return round(float(np.mean(peaks)) / 1024, 1)
+
+
+def peak_rss_mb():
+    # На Linux ru_maxrss в килобайтах
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def run_config(suite, config, source):
+    if suite == "recognize":
+        inputs = synthetic_landmarks(source["frames"] * 10, seed=source["seed"])
+    else:
+        inputs = load_frames(source)
+    if not inputs:
+        raise ValueError("Нет кадров для замера")
+
+    process, finalize = build_runner(suite, config)
+    try:
+        result = measure(process, inputs)
+        result["alloc_peak_kb"] = allocation_peak_kb(process, inputs)
+    finally:
+        if finalize:
+            finalize()
+    result.update(suite=suite, config=config, peak_rss_mb=peak_rss_mb())
+    return result
+
+
+def run_isolated(suite, config, source):
+    """Каждая конфигурация - в свежем процессе, чтобы пиковая память не смешивалась"""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(run_config, (suite, config, source))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def add_speedups(results):
+    """Ускорение конфигураций относительно их базовых (поле baseline в конфигурации)"""
+    by_name = {r["config"]["name"]: r for r in results}
+    for result in results:
+        base = by_name.get(result["config"].get("baseline"))
+        if base:
+            result["speedup"] = round(result["throughput_per_s"] / base["throughput_per_s"], 2)
+            result["p95_speedup"] = round(base["p95_ms"] / result["p95_ms"], 2)
+            print(f"{result['config']['name']}: ускорение x{result['speedup']} "
+                  f"(p95 x{result['p95_speedup']}) относительно {base['config']['name']}, выделения на вход "
+                  f"{base['alloc_peak_kb']} -> {result['alloc_peak_kb']} КБ", file=sys.stderr)
+
+
+def run_benchmarks(suites, source, isolate=True):
+    results = []
+    for suite in suites:
+        for config in SUITES[suite]:
+            print(f"Замер {config['name']}...", file=sys.stderr)
+            run = run_isolated if isolate else run_config
+            results.append(run(suite, config, source))
+    add_speedups(results)
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "source": source,
+        },
+        "results": results,
+    }
+
+
+def compare(base_path, new_path):
+    """Печатает изменения пропускной способности и p95 между двумя прогонами"""
+    with open(base_path, encoding="utf-8") as f:
+        base = {r["config"]["name"]: r for r in json.load(f)["results"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = {r["config"]["name"]: r for r in json.load(f)["results"]}
+
+    print(f"{'конфигурация':40} {'было/с':>10} {'стало/с':>10} {'Δ':>8} {'p95 было':>10} {'p95 стало':>10}")
+    for name in sorted(base.keys() & new.keys()):
+        old, cur = base[name], new[name]
+        delta = (cur["throughput_per_s"] / old["throughput_per_s"] - 1) * 100
+        print(f"{name:40} {old['throughput_per_s']:>10.1f} {cur['throughput_per_s']:>10.1f} "
+              f"{delta:>+7.1f}% {old['p95_ms']:>10.2f} {cur['p95_ms']:>10.2f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности без камеры и GUI")
+    parser.add_argument("--suite", action="append", choices=sorted(SUITES),
+                        help="набор замеров (можно несколько раз); по умолчанию все")
+    parser.add_argument("--video", help="записанное видео вместо синтетических кадров")
+    parser.add_argument("--frames", type=int, default=200, help="число кадров (для видео - максимум)")
+    parser.add_argument("--seed", type=int, default=0, help="зерно синтетических кадров")
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    parser.add_argument("--in-process", action="store_true",
+                        help="не запускать конфигурации в отдельных процессах (пиковая память общая)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"),
+                        help="сравнить два файла результатов")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    source = {"video": args.video, "frames": args.frames, "seed": args.seed}
+    report = run_benchmarks(args.suite or list(SUITES), source, isolate=not args.in_process)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
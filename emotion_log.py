@@ -0,0 +1,249 @@
+import argparse
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Порядок классов на выходе модели эмоций DeepFace
+EMOTION_LABELS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+
+
+def _chunk_name(sequence, first, last):
+    # Интервал времени в имени: читатель отбрасывает лишние куски, не открывая их
+    return f"{sequence:08d}_{math.floor(first * 1000)}_{math.ceil(last * 1000)}.npz"
+
+
+def _parse_chunk_name(name):
+    sequence, first, last = os.path.splitext(name)[0].split("_")
+    return int(sequence), int(first) / 1000, int(last) / 1000
+
+
+class RollingEmotionStats:
+    """Скользящие агрегаты по минутам: число лиц, суммы оценок и доминирующие эмоции.
+    Обновляются по одной строке, память ограничена числом хранимых минут"""
+
+    def __init__(self, bucket_seconds=60, buckets=60):
+        self.bucket_seconds = bucket_seconds
+        self._lock = threading.Lock()
+        self._buckets = deque(maxlen=buckets)  # [начало, число, суммы (7,), доминирующие (7,)]
+        self.total_count = 0
+        self.total_sums = np.zeros(len(EMOTION_LABELS))
+
+    def add(self, timestamp, scores):
+        start = timestamp - timestamp % self.bucket_seconds
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] < start:
+                self._buckets.append([start, 0, np.zeros(len(EMOTION_LABELS)),
+                                      np.zeros(len(EMOTION_LABELS), dtype=np.int64)])
+            bucket = self._buckets[-1]
+            bucket[1] += 1
+            bucket[2] += scores
+            bucket[3][int(np.argmax(scores))] += 1
+            self.total_count += 1
+            self.total_sums += scores
+
+    def minutes(self):
+        """[{start, count, mean, dominant}] по хранимым минутам, от старых к новым"""
+        with self._lock:
+            buckets = [(start, count, sums.copy(), dominant.copy())
+                       for start, count, sums, dominant in self._buckets]
+        return [{"start": start, "count": count,
+                 "mean": dict(zip(EMOTION_LABELS, np.round(sums / count, 2).tolist())),
+                 "dominant": EMOTION_LABELS[int(dominant.argmax())]}
+                for start, count, sums, dominant in buckets]
+
+    def averages(self):
+        with self._lock:
+            if not self.total_count:
+                return {}
+            return dict(zip(EMOTION_LABELS, np.round(self.total_sums / self.total_count, 2).tolist()))
+
+
+class EmotionLogWriter:
+    """Журнал эмоций только на дозапись: время, рамка лица и все семь оценок.
+    Анализ лишь кладет результат в ограниченную очередь; столбцы копит и пишет кусками
+    (.npz по столбцам) фоновый поток. При переполнении очереди результат отбрасывается"""
+
+    def __init__(self, directory, chunk_rows=4096, flush_seconds=10.0, max_queue=256, stats=None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        existing = [_parse_chunk_name(name)[0] for name in os.listdir(directory) if name.endswith(".npz")]
+        self.sequence = max(existing, default=0)
+        self.chunk_rows = chunk_rows
+        self.flush_seconds = flush_seconds
+        self.aggregates = stats or RollingEmotionStats()
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._timestamps = np.empty(chunk_rows, dtype=np.float64)
+        self._boxes = np.empty((chunk_rows, 4), dtype=np.int32)
+        self._scores = np.empty((chunk_rows, len(EMOTION_LABELS)), dtype=np.float32)
+        self._rows = 0
+        self._chunk_started = None
+        self.stats = {"emotion_log_rows": 0, "emotion_log_chunks": 0, "emotion_log_dropped": 0}
+
+        self._thread = threading.Thread(target=self._run, name="emotion-log", daemon=True)
+        self._thread.start()
+
+    def log(self, timestamp, faces):
+        """Не блокирует: лица одного кадра в формате DeepFace.analyze"""
+        if not faces:
+            return
+        try:
+            self._queue.put_nowait((timestamp, faces))
+        except queue.Full:
+            self.stats["emotion_log_dropped"] += len(faces)
+
+    def _run(self):
+        while True:
+            timeout = None
+            if self._chunk_started is not None:
+                timeout = max(self._chunk_started + self.flush_seconds - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._flush()  # кусок копится слишком долго - пишем неполный
+                continue
+            if item is None:
+                self._flush()
+                return
+
+            timestamp, faces = item
+            for face in faces:
+                self._append(timestamp, face)
+
+    def _append(self, timestamp, face):
+        if self._chunk_started is None:
+            self._chunk_started = time.monotonic()
+        row = self._rows
+        region = face["region"]
+        self._timestamps[row] = timestamp
+        self._boxes[row] = (region["x"], region["y"], region["w"], region["h"])
+        scores = self._scores[row]
+        scores[:] = [face["emotion"][label] for label in EMOTION_LABELS]
+        self.aggregates.add(timestamp, scores)
+        self._rows += 1
+        if self._rows == self.chunk_rows:
+            self._flush()
+
+    def _flush(self):
+        rows, self._rows = self._rows, 0
+        self._chunk_started = None
+        if not rows:
+            return
+        self.sequence += 1
+        path = os.path.join(self.directory, _chunk_name(self.sequence, self._timestamps[0],
+                                                         self._timestamps[rows - 1]))
+        # Пишем во временный файл и переименовываем: читатель не увидит недописанный кусок
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, timestamp=self._timestamps[:rows], box=self._boxes[:rows], scores=self._scores[:rows])
+        os.replace(tmp_path, path)
+        self.stats["emotion_log_rows"] += rows
+        self.stats["emotion_log_chunks"] += 1
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+class EmotionLogReader:
+    """Чтение журнала по кускам; куски вне интервала времени отбрасываются по имени файла"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def chunk_paths(self, start=None, end=None):
+        chunks = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".npz"):
+                continue
+            sequence, first, last = _parse_chunk_name(name)
+            if (start is not None and last < start) or (end is not None and first > end):
+                continue
+            chunks.append((sequence, os.path.join(self.directory, name)))
+        return [path for _, path in sorted(chunks)]
+
+    def iter_chunks(self, start=None, end=None, columns=("timestamp", "box", "scores")):
+        """Словари столбцов по кускам; читаются только нужные столбцы"""
+        for path in self.chunk_paths(start, end):
+            with np.load(path) as data:
+                chunk = {column: data[column] for column in set(columns) | {"timestamp"}}
+            if start is not None or end is not None:
+                timestamps = chunk["timestamp"]
+                mask = np.ones(len(timestamps), dtype=bool)
+                if start is not None:
+                    mask &= timestamps >= start
+                if end is not None:
+                    mask &= timestamps <= end
+                if not mask.all():
+                    chunk = {column: values[mask] for column, values in chunk.items()}
+            yield chunk
+
+    def read(self, start=None, end=None, columns=("timestamp", "box", "scores")):
+        chunks = list(self.iter_chunks(start, end, columns))
+        if not chunks:
+            return {column: np.empty(0) for column in columns}
+        return {column: np.concatenate([chunk[column] for chunk in chunks]) for column in columns}
+
+    def per_minute(self, start=None, end=None, bucket_seconds=60):
+        """Те же агрегаты, что у RollingEmotionStats, по всему журналу одним проходом"""
+        totals = {}
+        for chunk in self.iter_chunks(start, end, columns=("timestamp", "scores")):
+            buckets = (chunk["timestamp"] // bucket_seconds).astype(np.int64)
+            keys, inverse = np.unique(buckets, return_inverse=True)
+            classes = len(EMOTION_LABELS)
+            scores = chunk["scores"]
+            sums = np.stack([np.bincount(inverse, weights=scores[:, k], minlength=len(keys))
+                             for k in range(classes)], axis=1)
+            dominant = np.bincount(inverse * classes + scores.argmax(axis=1),
+                                   minlength=len(keys) * classes).reshape(len(keys), classes)
+            counts = np.bincount(inverse, minlength=len(keys))
+            for i, key in enumerate(keys.tolist()):
+                # Минута может попасть на границу кусков - складываем
+                entry = totals.setdefault(key, [0, np.zeros(classes), np.zeros(classes, dtype=np.int64)])
+                entry[0] += counts[i]
+                entry[1] += sums[i]
+                entry[2] += dominant[i]
+
+        return [{"start": key * bucket_seconds, "count": int(count),
+                 "mean": dict(zip(EMOTION_LABELS, np.round(sums / count, 2).tolist())),
+                 "dominant": EMOTION_LABELS[int(dominant.argmax())]}
+                for key, (count, sums, dominant) in sorted(totals.items())]
+
+
+def _parse_time(value):
+    """Время как число секунд эпохи или ГГГГ-ММ-ДДTЧЧ:ММ:СС (локальное)"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return time.mktime(time.strptime(value, "%Y-%m-%dT%H:%M:%S"))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Сводка по журналу эмоций (face.py --emotion-log)")
+    parser.add_argument("directory", help="папка журнала")
+    parser.add_argument("--start", help="начало интервала: секунды эпохи или ГГГГ-ММ-ДДTЧЧ:ММ:СС")
+    parser.add_argument("--end", help="конец интервала")
+    parser.add_argument("--bucket", type=float, default=60, help="длина интервала агрегации, с")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    reader = EmotionLogReader(args.directory)
+    started = time.perf_counter()
+    rows = reader.per_minute(_parse_time(args.start), _parse_time(args.end), args.bucket)
+    elapsed = time.perf_counter() - started
+
+    for row in rows:
+        moment = time.strftime("%Y-%m-%d %H:%M", time.localtime(row["start"]))
+        mean = ", ".join(f"{label} {value:.1f}" for label, value in row["mean"].items())
+        print(f"{moment}  лиц: {row['count']:6d}  чаще всего: {row['dominant']:9}  {mean}")
+    print(f"Интервалов: {len(rows)}, записей: {sum(row['count'] for row in rows)}, "
+          f"прочитано за {elapsed:.2f} с")
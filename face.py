@@ -1,15 +1,854 @@
+import time
+
+_import_started = time.perf_counter()
+
 import tkinter as tk
 from tkinter import messagebox
 from PIL import Image, ImageTk
 import cv2
 from deepface import DeepFace
+import numpy as np
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
 import threading
-import time
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import queue
+import platform
+import sys
+from multiprocessing import shared_memory
+from collections import OrderedDict, deque
+
+from emotion_log import EMOTION_LABELS, EmotionLogWriter
+from frame_sources import IMAGE_EXTENSIONS, add_source_argument, open_source
+from metrics import StageMetrics, StartupProfiler, add_metrics_arguments, metrics_from_args
+
+
+class LatestFrameSlot:
+    """Слот «последнего кадра»: новый кадр затирает предыдущий"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._frame = None
+        self._frame_id = 0
+        self._captured_at = 0.0
+        self.overwritten = 0  # кадры, затертые до того, как их кто-то прочитал
+        self._consumed_id = 0
+        self.closed = False
+
+    def put(self, frame):
+        with self._cond:
+            if self._frame_id > self._consumed_id:
+                self.overwritten += 1
+            self._frame_id += 1
+            self._frame = frame
+            self._captured_at = time.perf_counter()
+            self._cond.notify_all()
+
+    def get(self, last_id, timeout=None):
+        """Ждет кадр новее last_id; возвращает (id, кадр, число пропущенных кадров, время захвата)"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._frame_id > last_id or self.closed, timeout)
+            return self._take(last_id)
+
+    def peek(self, last_id):
+        """То же, что get, но без ожидания"""
+        with self._cond:
+            return self._take(last_id)
+
+    def _take(self, last_id):
+        if self._frame_id <= last_id:
+            return last_id, None, 0, None
+        self._consumed_id = self._frame_id
+        skipped = self._frame_id - last_id - 1 if last_id else 0
+        return self._frame_id, self._frame, skipped, self._captured_at
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class DropOldestQueue:
+    """Ограниченная очередь: при переполнении вытесняется самый старый элемент"""
+
+    def __init__(self, maxsize=1):
+        self._lock = threading.Lock()
+        self._items = deque()
+        self.maxsize = maxsize
+        self.dropped = 0
+
+    def put(self, item):
+        with self._lock:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+
+    def get_nowait(self):
+        with self._lock:
+            return self._items.popleft() if self._items else None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+
+class PipelineStats:
+    """Потокобезопасные счетчики стадий конвейера"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {
+            "captured": 0, "analyzed": 0, "rendered": 0,
+            "inference_dropped": 0, "render_dropped": 0,
+        }
+        self._averages = {}
+
+    def increment(self, name, value=1):
+        if value:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds, smoothing=0.1):
+        """Скользящее среднее времени стадии в миллисекундах"""
+        with self._lock:
+            previous = self._averages.get(name)
+            value = seconds * 1000
+            self._averages[name] = value if previous is None else \
+                previous + smoothing * (value - previous)
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot.update({f"{name}_ms": round(value, 2) for name, value in self._averages.items()})
+            return snapshot
+
+
+class DisplayBuffer:
+    """Предвыделенные буферы отрисовки и один PhotoImage, переиспользуемый через paste()"""
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics or StageMetrics(enabled=False)
+        self.size = None
+        self.resized = None
+        self.rgba = None
+        self.image = None
+        self.photo = None
+        self.allocations = 0  # сколько раз пришлось пересоздать буферы (смена размера)
+
+    @staticmethod
+    def fit(frame_w, frame_h, bound_w, bound_h):
+        """Размер кадра, вписанного в область с сохранением пропорций"""
+        scale = min(bound_w / frame_w, bound_h / frame_h)
+        return max(int(frame_w * scale), 1), max(int(frame_h * scale), 1)
+
+    def ensure(self, size):
+        if size == self.size:
+            return
+        w, h = size
+        self.size = size
+        self.resized = np.empty((h, w, 3), dtype=np.uint8)
+        # RGBA, а не RGB: только для 4-байтных режимов PIL разделяет память с буфером,
+        # так что Image ниже - вид на self.rgba без копирования, и paste() читает его напрямую
+        self.rgba = np.empty((h, w, 4), dtype=np.uint8)
+        self.image = Image.frombuffer("RGBA", size, self.rgba, "raw", "RGBA", 0, 1)
+        self.photo = ImageTk.PhotoImage("RGBA", size)
+        self.allocations += 1
+
+    def render(self, frame, size, draw=None):
+        """Масштабирует кадр в буфер, дает дорисовать поверх и обновляет PhotoImage"""
+        self.ensure(size)
+        with self.metrics.stage("resize"):
+            cv2.resize(frame, size, dst=self.resized, interpolation=cv2.INTER_AREA)
+        if draw is not None:
+            draw(self.resized, size[0] / frame.shape[1], size[1] / frame.shape[0])
+        with self.metrics.stage("color_convert"):
+            cv2.cvtColor(self.resized, cv2.COLOR_BGR2RGBA, dst=self.rgba)
+        with self.metrics.stage("photo_image"):
+            self.photo.paste(self.image)
+        return self.photo
+
+
+class EmotionAnalyzer:
+    """Детекция лиц и пакетная классификация эмоций на моделях DeepFace"""
+
+    def __init__(self, detector_backend='opencv', detect_scale=1.0):
+        self.detector_backend = detector_backend
+        self.detect_scale = detect_scale  # детекция на уменьшенной копии кадра; кропы - с полного
+        self.model = None
+
+    def load(self):
+        if self.model is None:
+            try:
+                client = DeepFace.build_model(model_name="Emotion", task="facial_attribute")
+            except TypeError:
+                # Старые версии DeepFace не знают аргумента task
+                client = DeepFace.build_model("Emotion")
+            # Новые версии оборачивают keras-модель в клиент
+            self.model = getattr(client, "model", client)
+        return self
+
+    def warm_up(self, profiler):
+        """Собирает модели и прогоняет пустой кадр, чтобы первый живой анализ не тормозил"""
+        dummy = np.zeros((480, 640, 3), dtype=np.uint8)
+        with profiler.measure("model_build"):
+            self.load()
+        with profiler.measure("detector_build"):
+            # Детектор DeepFace собирается лениво при первом вызове
+            self.detect(dummy)
+        with profiler.measure("first_inference"):
+            self.classify_batch([dummy[:48, :48]])
+
+    def detect(self, frame):
+        """Возвращает список (x, y, w, h, уверенность) найденных лиц в координатах frame"""
+        scale = self.detect_scale
+        small = frame
+        if scale < 1.0:
+            small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        faces = DeepFace.extract_faces(
+            small,
+            detector_backend=self.detector_backend,
+            enforce_detection=False,
+            align=False
+        )
+
+        frame_h, frame_w = frame.shape[:2]
+        # Обратный масштаб по фактическим размерам: resize округляет их до целых
+        scale_x, scale_y = frame_w / small.shape[1], frame_h / small.shape[0]
+        boxes = []
+        for face in faces:
+            area = face["facial_area"]
+            x, y = int(area["x"] * scale_x), int(area["y"] * scale_y)
+            w = min(int(round(area["w"] * scale_x)), frame_w - x)
+            h = min(int(round(area["h"] * scale_y)), frame_h - y)
+            boxes.append((x, y, w, h, face.get("confidence", 0)))
+        return boxes
+
+    @staticmethod
+    def preprocess(crop):
+        """BGR-кроп лица -> вход модели эмоций (48x48, оттенки серого, [0, 1])"""
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        gray = cv2.resize(gray, (48, 48), interpolation=cv2.INTER_AREA)
+        return gray.astype(np.float32) / 255.0
+
+    def classify_batch(self, crops):
+        """Классифицирует пачку кропов за один вызов модели"""
+        if not crops:
+            return []
+        self.load()
+        batch = np.stack([self.preprocess(crop) for crop in crops])[..., np.newaxis]
+        predictions = np.asarray(self.model.predict_on_batch(batch))
+
+        emotions = []
+        for row in predictions:
+            total = float(row.sum()) or 1.0
+            emotions.append({label: 100 * float(value) / total
+                             for label, value in zip(EMOTION_LABELS, row)})
+        return emotions
+
+    def analyze_batch(self, frames):
+        """Анализ нескольких кадров: детекция по кадрам, классификация одной пачкой"""
+        regions, crops, owners = [], [], []
+        for index, frame in enumerate(frames):
+            for x, y, w, h, face_confidence in self.detect(frame):
+                crop = frame[max(y, 0):y + h, max(x, 0):x + w]
+                if crop.size == 0:
+                    continue
+                crops.append(crop)
+                owners.append(index)
+                regions.append((x, y, w, h, face_confidence))
+
+        results = [[] for _ in frames]
+        for owner, region, emotion in zip(owners, regions, self.classify_batch(crops)):
+            results[owner].append(make_result(emotion, region[:4], region[4]))
+        return results
+
+    def analyze(self, frame):
+        """Результат в формате DeepFace.analyze (список словарей по лицам)"""
+        return self.analyze_batch([frame])[0]
+
+
+# Детекторы DeepFace, которые пробуются при автовыборе; недоступные в этой установке пропускаются
+DETECTOR_BACKENDS = ["opencv", "ssd", "yunet", "mediapipe", "mtcnn", "retinaface", "centerface",
+                     "yolov8", "dlib"]
+DEFAULT_DETECTOR = "opencv"
+DETECTOR_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "emotion_app", "detector.json")
+
+
+def _is_detection(box, frame):
+    # Без enforce_detection DeepFace возвращает весь кадр с нулевой уверенностью, если лица нет
+    x, y, w, h, confidence = box
+    return bool(confidence) or w < frame.shape[1] or h < frame.shape[0]
+
+
+def benchmark_detectors(frames, backends=DETECTOR_BACKENDS, warmup=1, detect_scale=1.0):
+    """Задержка детекции и доля кадров с найденным лицом для каждого детектора"""
+    results = []
+    for backend in backends:
+        analyzer = EmotionAnalyzer(backend, detect_scale)
+        try:
+            # Первый вызов собирает модель детектора - в замер не идет
+            for frame in frames[:warmup]:
+                analyzer.detect(frame)
+            latencies = np.empty(len(frames))
+            hits = 0
+            for i, frame in enumerate(frames):
+                started = time.perf_counter()
+                boxes = analyzer.detect(frame)
+                latencies[i] = (time.perf_counter() - started) * 1000
+                hits += any(_is_detection(box, frame) for box in boxes)
+        except Exception as e:
+            results.append({"backend": backend, "available": False, "error": str(e).splitlines()[0][:200]})
+            continue
+        results.append({
+            "backend": backend, "available": True,
+            "mean_ms": round(float(latencies.mean()), 2),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+            "detection_rate": round(hits / len(frames), 3),
+        })
+    return results
+
+
+def select_detector(results, min_detection_rate=0.9):
+    """Самый быстрый детектор с долей детекций не ниже порога; если таких нет - самый точный"""
+    available = [r for r in results if r["available"]]
+    if not available:
+        return DEFAULT_DETECTOR
+    passing = [r for r in available if r["detection_rate"] >= min_detection_rate]
+    if passing:
+        return min(passing, key=lambda r: r["mean_ms"])["backend"]
+    return max(available, key=lambda r: (r["detection_rate"], -r["mean_ms"]))["backend"]
+
+
+def machine_fingerprint():
+    """Ключ кэша выбора: машина и версия DeepFace"""
+    import deepface
+    return "|".join([platform.node(), platform.machine(), platform.processor(), str(os.cpu_count()),
+                     getattr(deepface, "__version__", "?")])
+
+
+def load_detector_choice(min_detection_rate, detect_scale=1.0, path=DETECTOR_CACHE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            entry = json.load(f).get(machine_fingerprint())
+    except (OSError, ValueError):
+        return None
+    # Выбор действителен только для тех же порога и масштаба детекции
+    if entry and entry["min_detection_rate"] == min_detection_rate and \
+            entry.get("detect_scale", 1.0) == detect_scale:
+        return entry["backend"]
+    return None
+
+
+def save_detector_choice(backend, min_detection_rate, results, detect_scale=1.0, path=DETECTOR_CACHE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    cache[machine_fingerprint()] = {"backend": backend, "min_detection_rate": min_detection_rate,
+                                    "detect_scale": detect_scale, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def sample_frames(spec, count=30):
+    """Кадры для замера детекторов: из видео или папки без задержек, с камеры - подряд"""
+    spec = str(spec)
+    if os.path.exists(spec):
+        media = iter_media(spec, frame_step=1)
+        return [item[3] for _, item in zip(range(count), media)]
+
+    source = open_source(spec, 640, 480, threaded=False)
+    frames = []
+    try:
+        while source.isOpened() and len(frames) < count:
+            ret, frame = source.read()
+            if not ret:
+                break
+            frames.append(frame)
+    finally:
+        source.release()
+    return frames
+
+
+def resolve_detector_backend(detector="auto", sample=None, min_detection_rate=0.9, detect_scale=1.0,
+                             cache_path=DETECTOR_CACHE, benchmark=False):
+    """Детектор для запуска: заданный явно, выбранный замером на этой машине или по умолчанию.
+    Замер (все детекторы, с загрузкой их весов) идет только при benchmark=True;
+    sample - функция, возвращающая кадры для замера (вызывается только при замере)"""
+    if detector and detector != "auto":
+        return detector
+    if not benchmark:
+        cached = load_detector_choice(min_detection_rate, detect_scale, cache_path)
+        if cached:
+            return cached
+        print(f"Детектор не выбран замером, используется {DEFAULT_DETECTOR} "
+              f"(выбрать самый быстрый: --benchmark-detectors)")
+        return DEFAULT_DETECTOR
+
+    frames = sample() if sample else []
+    if not frames:
+        print(f"Нет кадров для замера детекторов, используется {DEFAULT_DETECTOR}")
+        return DEFAULT_DETECTOR
+
+    results = benchmark_detectors(frames, detect_scale=detect_scale)
+    backend = select_detector(results, min_detection_rate)
+    for r in results:
+        if r["available"]:
+            print(f"  {r['backend']:12} {r['mean_ms']:8.1f} мс (p95 {r['p95_ms']:.1f})  "
+                  f"лица на {r['detection_rate']:.0%} кадров")
+        else:
+            print(f"  {r['backend']:12} недоступен: {r['error']}")
+    print(f"Выбран детектор: {backend} (кадров в замере: {len(frames)})")
+
+    # Запасной выбор «самый точный» не проверен: на выборке без лиц (пустая комната, темнота)
+    # он случаен, поэтому в кэш попадает только детектор, прошедший порог
+    if any(r["available"] and r["detection_rate"] >= min_detection_rate for r in results):
+        save_detector_choice(backend, min_detection_rate, results, detect_scale, cache_path)
+    else:
+        print(f"Ни один детектор не нашел лица на {min_detection_rate:.0%} кадров - выбор не сохранен; "
+              f"повторите замер на кадрах с лицом (--detector-sample)")
+    return backend
+
+
+def make_result(emotion, box, face_confidence=0):
+    """Собирает словарь результата в формате DeepFace.analyze"""
+    x, y, w, h = (int(v) for v in box)
+    return {
+        "emotion": emotion,
+        "dominant_emotion": max(emotion, key=emotion.get),
+        "region": {"x": x, "y": y, "w": w, "h": h},
+        "face_confidence": face_confidence,
+    }
+
+
+class FaceTracker:
+    """Трекер лица на оптическом потоке Лукаса-Канаде между полными детекциями"""
+
+    LK_PARAMS = dict(winSize=(21, 21), maxLevel=3,
+                     criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+    def __init__(self, max_points=40, min_points=8, max_fb_error=1.5):
+        self.max_points = max_points
+        self.min_points = min_points
+        self.max_fb_error = max_fb_error  # допустимая ошибка прямого/обратного потока, px
+        self.reset()
+
+    def reset(self):
+        self.prev_gray = None
+        self.points = None
+        self.box = None
+
+    @property
+    def active(self):
+        return self.box is not None
+
+    def start(self, frame, box):
+        """Начинает трек с рамки (x, y, w, h); False, если в рамке не за что зацепиться"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        x, y, w, h = (int(v) for v in box)
+
+        # Берем точки из центральной части рамки, чтобы не цеплять фон
+        mask = np.zeros_like(gray)
+        mask[y + h // 10:y + h - h // 10, x + w // 10:x + w - w // 10] = 255
+        points = cv2.goodFeaturesToTrack(gray, self.max_points, 0.01, 5, mask=mask)
+
+        if points is None or len(points) < self.min_points:
+            self.reset()
+            return False
+
+        self.prev_gray = gray
+        self.points = points.astype(np.float32)
+        self.box = np.array([x, y, w, h], dtype=np.float32)
+        return True
+
+    def update(self, frame):
+        """Сдвигает рамку на новый кадр; None, если трек потерян"""
+        if not self.active:
+            return None
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(
+            self.prev_gray, gray, self.points, None, **self.LK_PARAMS)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(
+            gray, self.prev_gray, moved, None, **self.LK_PARAMS)
+
+        fb_error = np.linalg.norm((self.points - back).reshape(-1, 2), axis=1)
+        good = (status.ravel() == 1) & (back_status.ravel() == 1) & (fb_error < self.max_fb_error)
+        if good.sum() < self.min_points:
+            self.reset()
+            return None
+
+        old = self.points.reshape(-1, 2)[good]
+        new = moved.reshape(-1, 2)[good]
+
+        # Сдвиг - медиана смещений точек, масштаб - медиана отношения разбросов
+        shift = np.median(new - old, axis=0)
+        old_spread = np.linalg.norm(old - old.mean(axis=0), axis=1)
+        new_spread = np.linalg.norm(new - new.mean(axis=0), axis=1)
+        valid = old_spread > 1
+        scale = float(np.median(new_spread[valid] / old_spread[valid])) if valid.any() else 1.0
+
+        x, y, w, h = self.box
+        cx, cy = x + w / 2 + shift[0], y + h / 2 + shift[1]
+        w, h = w * scale, h * scale
+
+        frame_h, frame_w = gray.shape
+        if w < 20 or h < 20 or not (0 <= cx < frame_w and 0 <= cy < frame_h):
+            self.reset()
+            return None
+
+        self.box = np.array([cx - w / 2, cy - h / 2, w, h], dtype=np.float32)
+        self.prev_gray = gray
+        self.points = new.reshape(-1, 1, 2)
+        return self.clipped_box(frame_w, frame_h)
+
+    def clipped_box(self, frame_w, frame_h):
+        x, y, w, h = self.box
+        x0, y0 = max(int(x), 0), max(int(y), 0)
+        x1, y1 = min(int(x + w), frame_w), min(int(y + h), frame_h)
+        return x0, y0, x1 - x0, y1 - y0
+
+
+class EmotionCache:
+    """LRU-кэш распределений эмоций по перцептивному хэшу (dHash) кропа лица"""
+
+    def __init__(self, capacity=64, max_distance=6):
+        self.capacity = capacity
+        self.max_distance = max_distance  # порог по Хэммингу: больше - меньше CPU, ниже точность
+        self._entries = OrderedDict()
+        self.stats = {"cache_hits": 0, "cache_misses": 0, "cache_evictions": 0}
+
+    @staticmethod
+    def face_hash(crop):
+        """64-битный разностный хэш: знак градиента яркости на сетке 9x8"""
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+        bits = (small[:, 1:] > small[:, :-1]).ravel()
+        return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+    def lookup(self, key):
+        """Ближайшая запись в пределах порога или None"""
+        best_key, best_distance = None, self.max_distance + 1
+        for cached_key in self._entries:
+            distance = bin(cached_key ^ key).count("1")
+            if distance < best_distance:
+                best_key, best_distance = cached_key, distance
+                if not distance:
+                    break
+
+        if best_key is None:
+            self.stats["cache_misses"] += 1
+            return None
+        self.stats["cache_hits"] += 1
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key]
+
+    def store(self, key, emotion):
+        self._entries[key] = emotion
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.stats["cache_evictions"] += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SceneChangeGate:
+    """Решает, нужен ли новый анализ: доля изменившихся пикселей уменьшенного серого кадра
+    относительно кадра прошлого анализа. Не чаще min_interval, при движении - сразу,
+    в статичной сцене - раз в max_interval"""
+
+    def __init__(self, min_interval=0.2, max_interval=2.0, threshold=0.01, pixel_delta=12, size=(64, 48)):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.threshold = threshold  # доля изменившихся пикселей; 0 - анализировать всегда
+        self.pixel_delta = pixel_delta  # изменение яркости пикселя меньше этого - шум сенсора
+        self.size = size
+        self.reference = None
+        self.last_analysis = 0.0
+        self.motion = 0.0
+        self.stats = {"gate_performed": 0, "gate_skipped": 0, "gate_forced": 0}
+
+    def reset(self):
+        self.reference = None
+        self.last_analysis = 0.0
+
+    def wait_time(self, now):
+        """Сколько секунд до того, как анализ станет допустим"""
+        return max(self.last_analysis + self.min_interval - now, 0.0)
+
+    def check(self, frame, now):
+        """True - кадр нужно анализировать (тогда он становится опорным)"""
+        # INTER_LINEAR на порядок дешевле INTER_AREA, а шум отсекает pixel_delta;
+        # уменьшаем до перевода в серый - так дешевле
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_LINEAR)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        elapsed = now - self.last_analysis
+
+        if self.reference is None or self.threshold <= 0:
+            analyze = True
+        elif elapsed >= self.max_interval:
+            analyze = True
+            self.stats["gate_forced"] += 1
+        else:
+            changed = cv2.absdiff(small, self.reference) > self.pixel_delta
+            self.motion = float(changed.mean())
+            analyze = self.motion >= self.threshold
+
+        if not analyze:
+            self.stats["gate_skipped"] += 1
+            return False
+        self.stats["gate_performed"] += 1
+        self.reference = small
+        self.last_analysis = now
+        return True
+
+
+class TrackedFaceAnalyzer:
+    """Полная детекция раз в N анализов или при потере трека, между ними - трекинг"""
+
+    def __init__(self, analyzer, detect_every=10, tracker=None, cache=None):
+        self.analyzer = analyzer
+        self.detect_every = detect_every
+        self.tracker = tracker or FaceTracker()
+        self.cache = cache  # EmotionCache или None, если кэш отключен
+        self.since_detection = 0
+        self.stats = {"detections": 0, "tracked": 0, "lost": 0}
+
+    def reset(self):
+        self.tracker.reset()
+        self.since_detection = 0
+
+    def locate(self, frame):
+        """Рамка лица (x, y, w, h, уверенность) или None"""
+        if self.tracker.active and self.since_detection < self.detect_every:
+            box = self.tracker.update(frame)
+            if box is not None:
+                self.since_detection += 1
+                self.stats["tracked"] += 1
+                return box + (None,)
+            self.stats["lost"] += 1
+
+        self.stats["detections"] += 1
+        self.since_detection = 0
+        boxes = self.analyzer.detect(frame)
+        if not boxes:
+            self.tracker.reset()
+            return None
+
+        # Следим за самым крупным лицом
+        x, y, w, h, confidence = max(boxes, key=lambda b: b[2] * b[3])
+        frame_h, frame_w = frame.shape[:2]
+        if w >= frame_w and h >= frame_h:
+            # Детектор ничего не нашел и вернул весь кадр - трекать нечего
+            self.tracker.reset()
+        else:
+            self.tracker.start(frame, (x, y, w, h))
+        return x, y, w, h, confidence
+
+    def analyze(self, frame):
+        """Результат в формате DeepFace.analyze; классификатор видит только кроп лица"""
+        located = self.locate(frame)
+        if located is None:
+            return []
+
+        x, y, w, h, confidence = located
+        crop = frame[max(y, 0):y + h, max(x, 0):x + w]
+        if crop.size == 0:
+            return []
+
+        # Почти тот же кроп, что и недавно, - берем готовое распределение
+        emotion = None
+        if self.cache is not None:
+            key = self.cache.face_hash(crop)
+            emotion = self.cache.lookup(key)
+        if emotion is None:
+            emotion = self.analyzer.classify_batch([crop])[0]
+            if self.cache is not None:
+                self.cache.store(key, emotion)
+        return [make_result(emotion, (x, y, w, h), confidence)]
+
+
+def _emotion_process_worker(tasks, results, detector_backend, detect_every, cache_threshold, detect_scale):
+    """Процесс анализа: читает кадры из общей памяти, отвечает (поколение, id кадра, слот, лица)"""
+    shm = None
+    try:
+        analyzer = EmotionAnalyzer(detector_backend, detect_scale)
+        analyzer.warm_up(StartupProfiler())
+        cache = EmotionCache(max_distance=cache_threshold) if cache_threshold >= 0 else None
+        face_analyzer = TrackedFaceAnalyzer(analyzer, detect_every, cache=cache)
+        results.put(("ready", None, os.getpid(), None, None))
+
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+
+            generation, frame_id, shm_name, slot_bytes, slot, shape = task
+            # Кольцо создается по первому кадру и пересоздается при смене размера кадра
+            if shm is None or shm.name != shm_name:
+                if shm is not None:
+                    shm.close()
+                shm = shared_memory.SharedMemory(name=shm_name)
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+            try:
+                faces = face_analyzer.analyze(frame)
+            except Exception as e:
+                print(f"Ошибка анализа в процессе {os.getpid()}: {e}")
+                faces = None
+            # Отпускаем вид на общую память до того, как слот вернется захвату
+            del frame
+            results.put(("result", generation, frame_id, slot, faces))
+    finally:
+        if shm is not None:
+            shm.close()
+
+
+class ProcessEmotionPool:
+    """Пул процессов анализа эмоций; кадры передаются через кольцо в общей памяти"""
+
+    def __init__(self, processes=2, detector_backend='opencv', detect_every=10,
+                 cache_threshold=6, detect_scale=1.0):
+        self.processes = processes
+        self.slot_bytes = 0  # размер слота задает первый кадр (см. submit)
+        self.slot_count = processes * 2  # по слоту на обрабатываемый и на ожидающий кадр
+        self.worker_args = (detector_backend, detect_every, cache_threshold, detect_scale)
+        self.shm = None
+        self.workers = []
+        self.free_slots = deque(range(self.slot_count))
+        self.in_flight = 0
+        self.generation = 0  # номер запуска камеры: результаты прошлых запусков не публикуются
+        self.published_id = 0
+        self.stats = {"pool_submitted": 0, "pool_completed": 0,
+                      "pool_stale_results": 0, "pool_ring_full": 0}
+
+    def start(self):
+        # spawn, а не fork: пул запускается из фонового потока при работающем Tk и уже
+        # импортированном TensorFlow, а они не переживают fork
+        ctx = multiprocessing.get_context("spawn")
+        self.tasks = ctx.Queue()
+        self.results = ctx.Queue()
+        for _ in range(self.processes):
+            worker = ctx.Process(target=_emotion_process_worker,
+                                 args=(self.tasks, self.results) + self.worker_args, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def _allocate_ring(self, slot_bytes):
+        """Кольцо в общей памяти под кадры такого размера; вызывается, когда в работе нет кадров"""
+        self._release_ring()
+        self.shm = shared_memory.SharedMemory(create=True, size=slot_bytes * self.slot_count)
+        self.slot_bytes = slot_bytes
+        self.free_slots = deque(range(self.slot_count))
+
+    def _release_ring(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def wait_ready(self, timeout=300):
+        """Ждет, пока все процессы соберут и прогреют модели"""
+        deadline = time.time() + timeout
+        ready = 0
+        while ready < self.processes:
+            kind = self.results.get(timeout=max(deadline - time.time(), 0.01))[0]
+            if kind == "ready":
+                ready += 1
+
+    def reset_sequence(self):
+        """Номера кадров начинаются заново (новый запуск камеры); кадры прошлого запуска,
+        еще не вернувшиеся из процессов, освободят слоты, но опубликованы не будут"""
+        self.generation += 1
+        self.published_id = 0
+
+    def has_capacity(self):
+        return self.in_flight < self.processes and bool(self.free_slots)
+
+    def submit(self, frame_id, frame):
+        """Копирует кадр в свободный слот кольца; False, если кольцо занято"""
+        if frame.nbytes > self.slot_bytes:
+            # Первый кадр или кадр крупнее слотов: кольцо пересоздается, как только пул освободится
+            if self.in_flight:
+                return False
+            self._allocate_ring(frame.nbytes)
+        if not self.free_slots:
+            self.stats["pool_ring_full"] += 1
+            return False
+
+        slot = self.free_slots.popleft()
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf,
+                          offset=slot * self.slot_bytes)
+        np.copyto(view, frame)
+        del view
+
+        self.tasks.put((self.generation, frame_id, self.shm.name, self.slot_bytes, slot, frame.shape))
+        self.in_flight += 1
+        self.stats["pool_submitted"] += 1
+        return True
+
+    def poll(self, timeout=0.0):
+        """Готовые результаты (id кадра, лица); опоздавшие относительно уже выданных отбрасываются"""
+        ready = []
+        while True:
+            try:
+                kind, generation, frame_id, slot, faces = self.results.get(timeout=timeout) if timeout \
+                    else self.results.get_nowait()
+            except queue.Empty:
+                break
+            timeout = 0.0
+            if kind != "result":
+                continue
+
+            self.free_slots.append(slot)
+            self.in_flight -= 1
+            self.stats["pool_completed"] += 1
+            if generation != self.generation or frame_id <= self.published_id:
+                self.stats["pool_stale_results"] += 1
+                continue
+            self.published_id = frame_id
+            ready.append((frame_id, faces))
+        return ready
+
+    def close(self):
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join(timeout=2.0)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
+        self._release_ring()
 
 
 class EmotionCameraApp:
-    def __init__(self, root):
+    def __init__(self, root, profiler=None, startup_report=None, cache_threshold=6,
+                 inference_processes=0, metrics=None, metrics_overlay=False, source="0",
+                 emotion_log=None, min_interval=0.2, max_interval=2.0, motion_threshold=0.01,
+                 detector="auto", detector_min_rate=0.9, detect_scale=1.0):
         self.root = root
+        self.source = source  # строка источника кадров для open_source
+
+        # Журнал всех оценок эмоций; запись на диск идет в своем потоке
+        self.emotion_log = EmotionLogWriter(emotion_log) if emotion_log else None
+
+        # Замеры стадий; выключенные метрики почти ничего не стоят
+        self.metrics = metrics or StageMetrics(enabled=False)
+        self.metrics_overlay = metrics_overlay
         self.root.title("Распознавание эмоций")
         self.root.geometry("800x700")
 
@@ -22,7 +861,7 @@ class EmotionCameraApp:
 
         self.start_btn = tk.Button(
             btn_frame, text="Запустить", command=self.start_camera,
-            font=("Arial", 12), bg="green", fg="white", width=15
+            font=("Arial", 12), bg="green", fg="white", width=15, state=tk.DISABLED
         )
         self.start_btn.pack(side=tk.LEFT, padx=5)
 
@@ -32,9 +871,14 @@ class EmotionCameraApp:
         )
         self.stop_btn.pack(side=tk.LEFT, padx=5)
 
-        # Видео (увеличенный размер)
-        self.video_label = tk.Label(root, bg="black")
-        self.video_label.pack(pady=10, padx=20, fill=tk.BOTH, expand=True)
+        # Видео (увеличенный размер). Рамка без распространения размера: ей достается место,
+        # оставшееся от остальных виджетов, и кадр подгоняется под нее, а не под метку,
+        # которая иначе растет вместе с показанной картинкой
+        self.video_frame = tk.Frame(root, bg="black", height=1)
+        self.video_frame.pack_propagate(False)
+        self.video_frame.pack(pady=10, padx=20, fill=tk.BOTH, expand=True)
+        self.video_label = tk.Label(self.video_frame, bg="black", bd=0, highlightthickness=0)
+        self.video_label.pack(fill=tk.BOTH, expand=True)
 
         # Результат
         self.result_label = tk.Label(
@@ -47,12 +891,54 @@ class EmotionCameraApp:
         )
         self.confidence_label.pack()
 
+        self.status_label = tk.Label(
+            root, text="Загрузка моделей...", font=("Arial", 10), fg="gray"
+        )
+        self.status_label.pack(pady=5)
+
         # Переменные
         self.is_running = False
         self.cap = None
         self.current_emotion = "—"
         self.current_confidence = 0
 
+        # Конвейер захват -> анализ -> отрисовка
+        # Анализ не чаще min_interval (детекция амортизирована трекингом), в статичной сцене - реже
+        self.scene_gate = SceneChangeGate(min_interval, max_interval, motion_threshold)
+        self.detect_every = 10  # полная детекция лица раз в N анализов
+        self.render_interval_ms = 33  # ~30 FPS отрисовки
+        self.display = DisplayBuffer(self.metrics)
+        self.shown_texts = None
+        self.frame_slot = None
+        self.result_queue = None
+        self.last_result = None
+        self.render_frame_id = 0
+        self.capture_thread = None
+        self.inference_thread = None
+        self.stats = None
+        # Детектор лиц: заданный явно или выбранный замером на этой машине (при прогреве)
+        self.detector = detector
+        self.detector_min_rate = detector_min_rate
+        self.detector_selected = threading.Event()
+        self.analyzer = EmotionAnalyzer(detector if detector != "auto" else DEFAULT_DETECTOR, detect_scale)
+        # cache_threshold < 0 отключает кэш эмоций
+        self.emotion_cache = EmotionCache(max_distance=cache_threshold) if cache_threshold >= 0 else None
+        self.face_analyzer = TrackedFaceAnalyzer(self.analyzer, self.detect_every,
+                                                 cache=self.emotion_cache)
+
+        # 0 - анализ в потоке этого процесса, N - в пуле из N процессов
+        self.inference_processes = inference_processes
+        self.process_pool = None
+        self.cache_threshold = cache_threshold
+
+        # Прогрев моделей в фоне сразу после запуска
+        self.profiler = profiler or StartupProfiler(_import_started, IMPORT_SECONDS)
+        self.startup_report = startup_report
+        self.warmup_state = "Загрузка моделей..."
+        self.models_ready = threading.Event()
+        threading.Thread(target=self.warm_up_models, daemon=True).start()
+        self.root.after(100, self.poll_warm_up)
+
         # Перевод эмоций
         self.emotion_dict = {
             "angry": "Злость", "disgust": "Отвращение", "fear": "Страх",
@@ -62,118 +948,526 @@ class EmotionCameraApp:
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
+    def warm_up_models(self):
+        try:
+            self.warmup_state = "Выбор детектора лиц..."
+            with self.profiler.measure("detector_select"):
+                # Окно не замеряет детекторы: только кэш --benchmark-detectors или детектор по умолчанию
+                self.analyzer.detector_backend = resolve_detector_backend(
+                    self.detector, min_detection_rate=self.detector_min_rate,
+                    detect_scale=self.analyzer.detect_scale
+                )
+            self.detector_selected.set()
+            self.warmup_state = "Загрузка моделей..."
+            if self.inference_processes:
+                # Модели собираются в каждом процессе пула, здесь только ждем готовности
+                with self.profiler.measure("process_pool_start"):
+                    self.process_pool = ProcessEmotionPool(
+                        self.inference_processes, self.analyzer.detector_backend,
+                        self.detect_every, self.cache_threshold, detect_scale=self.analyzer.detect_scale
+                    )
+                    self.process_pool.start()
+                    self.process_pool.wait_ready()
+            else:
+                self.analyzer.warm_up(self.profiler)
+            self.profiler.mark("models_ready")
+            self.warmup_state = f"Модели готовы ({self.profiler.timings['models_ready']:.1f} с)"
+        except Exception as e:
+            print(f"Ошибка загрузки моделей: {e}")
+            self.warmup_state = "Ошибка загрузки моделей"
+        finally:
+            self.detector_selected.set()
+            self.models_ready.set()
+
+        print(f"Профиль запуска: {self.profiler.report()}")
+        if self.startup_report:
+            self.profiler.save(self.startup_report)
+
+    def poll_warm_up(self):
+        """Показывает состояние прогрева; Tk трогаем только из главного потока"""
+        self.status_label.config(text=self.warmup_state)
+        if self.detector_selected.is_set() and not self.is_running:
+            self.start_btn.config(state=tk.NORMAL)
+        if not self.models_ready.is_set():
+            self.root.after(100, self.poll_warm_up)
+
     def start_camera(self):
-        if self.is_running:
+        if self.is_running or not self.detector_selected.is_set():
             return
 
-        self.cap = cv2.VideoCapture(0)
+        # Свежесть кадра обеспечивает собственный поток захвата, фоновый читатель не нужен
+        self.cap = open_source(self.source, 640, 480, threaded=False)
         if not self.cap.isOpened():
+            self.cap.release()
+            self.cap = None
             messagebox.showerror("Ошибка", "Не удалось открыть камеру")
             return
 
-        # Устанавливаем хорошее разрешение
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-
         self.is_running = True
         self.start_btn.config(state=tk.DISABLED)
         self.stop_btn.config(state=tk.NORMAL)
 
-        # Запускаем поток
-        threading.Thread(target=self.process_camera, daemon=True).start()
+        # Новый конвейер: свежие слоты, очереди и счетчики
+        self.frame_slot = LatestFrameSlot()
+        self.result_queue = DropOldestQueue(maxsize=1)
+        self.last_result = None
+        self.render_frame_id = 0
+        self.stats = PipelineStats()
+        self.face_analyzer.reset()
+        self.scene_gate.reset()
+        if self.emotion_cache is not None:
+            self.emotion_cache.clear()
+        if self.process_pool is not None:
+            self.process_pool.reset_sequence()
 
-    def process_camera(self):
-        last_analysis = 0
+        # Запускаем потоки захвата и анализа, отрисовка идет в главном потоке
+        self.capture_thread = threading.Thread(target=self.capture_loop, daemon=True)
+        self.inference_thread = threading.Thread(target=self.process_camera, daemon=True)
+        self.capture_thread.start()
+        self.inference_thread.start()
+        self.root.after(self.render_interval_ms, self.render_frame)
 
-        while self.is_running and self.cap:
-            ret, frame = self.cap.read()
+    def capture_loop(self):
+        """Стадия захвата: читает камеру без пауз и кладет кадр в слот"""
+        cap, slot = self.cap, self.frame_slot
+
+        while self.is_running:
+            with self.metrics.stage("capture_read"):
+                ret, frame = cap.read()
             if not ret:
                 break
+            self.stats.increment("captured")
+            slot.put(frame)
 
-            current_time = time.time()
-
-            # Анализируем каждую секунду
-            if current_time - last_analysis > 1.0:
-                try:
-                    # Распознавание эмоций
-                    result = DeepFace.analyze(
-                        frame,
-                        actions=['emotion'],
-                        detector_backend='opencv',  # Надежный и быстрый
-                        enforce_detection=False,
-                        silent=True
-                    )
+        slot.close()
+
+    def process_camera(self):
+        """Стадия анализа: всегда берет самый свежий кадр, устаревшие пропускает"""
+        slot, results, gate = self.frame_slot, self.result_queue, self.scene_gate
+        frame_id = 0
+
+        while self.is_running:
+            # Пока модели прогреваются, видео идет без анализа
+            if not self.models_ready.wait(timeout=0.1):
+                continue
+            if self.process_pool is not None:
+                return self.process_camera_pool()
+
+            # Выдерживаем минимальный интервал между анализами
+            wait = gate.wait_time(time.time())
+            if wait > 0:
+                time.sleep(min(wait, 0.05))
+                continue
+
+            frame_id, frame, skipped, _ = slot.get(frame_id, timeout=0.5)
+            if frame is None:
+                if slot.closed:
+                    break
+                continue
 
-                    if isinstance(result, list):
-                        result = result[0]
+            self.stats.increment("inference_dropped", skipped)
+            # Сцена не изменилась - оставляем прошлый результат
+            with self.metrics.stage("scene_gate"):
+                if not gate.check(frame, time.time()):
+                    continue
 
-                    self.current_emotion = result["dominant_emotion"]
-                    self.current_confidence = result["emotion"][self.current_emotion]
+            try:
+                # Распознавание эмоций
+                with self.metrics.stage("analyze"):
+                    faces = self.face_analyzer.analyze(frame)
+            except Exception as e:
+                print(f"Ошибка анализа: {e}")
+                faces = None
 
-                    # Рисуем рамку
-                    if "region" in result:
-                        x, y, w, h = result["region"]["x"], result["region"]["y"], \
-                            result["region"]["w"], result["region"]["h"]
-                        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                        cv2.putText(frame, self.current_emotion, (x, y - 10),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+            self.publish_faces(frame_id, faces, results)
 
-                    last_analysis = current_time
+    def process_camera_pool(self):
+        """Стадия анализа на пуле процессов: отправляет свежие кадры, собирает ответы"""
+        slot, results, pool, gate = self.frame_slot, self.result_queue, self.process_pool, self.scene_gate
+        frame_id = 0
 
-                except Exception as e:
-                    print(f"Ошибка анализа: {e}")
-                    self.current_emotion = "Ошибка"
-                    self.current_confidence = 0
+        while self.is_running:
+            for done_id, faces in pool.poll(timeout=0.005):
+                self.publish_faces(done_id, faces, results)
 
-            # Конвертируем кадр для Tkinter
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(rgb)
+            if not pool.has_capacity() or gate.wait_time(time.time()) > 0:
+                continue
 
-            # Подгоняем под размер окна
-            img.thumbnail((700, 500))
-            imgtk = ImageTk.PhotoImage(image=img)
+            frame_id, frame, skipped, _ = slot.get(frame_id, timeout=0.05)
+            if frame is None:
+                if slot.closed:
+                    break
+                continue
+
+            self.stats.increment("inference_dropped", skipped)
+            with self.metrics.stage("scene_gate"):
+                if not gate.check(frame, time.time()):
+                    continue
+            with self.metrics.stage("shm_submit"):
+                if not pool.submit(frame_id, frame):
+                    gate.reset()  # кадр не ушел в пул - следующий анализируем без проверки
+
+    def publish_faces(self, frame_id, faces, results):
+        """Обновляет текущую эмоцию и передает результат стадии отрисовки"""
+        if faces is None:
+            self.current_emotion = "Ошибка"
+            self.current_confidence = 0
+            result = None
+        else:
+            self.stats.increment("analyzed")
+            if self.emotion_log is not None:
+                self.emotion_log.log(time.time(), faces)
+            if faces:
+                result = faces[0]
+                self.current_emotion = result["dominant_emotion"]
+                self.current_confidence = result["emotion"][self.current_emotion]
+            else:
+                result = None
+                self.current_emotion = "—"
+                self.current_confidence = 0
+
+        # Отдаем результат отрисовке; старый непрочитанный результат вытесняется
+        results.put((frame_id, result))
+
+    def render_frame(self):
+        """Стадия отрисовки: выполняется в главном потоке Tk с частотой дисплея"""
+        if not self.is_running:
+            return
+
+        while True:
+            item = self.result_queue.get_nowait()
+            if item is None:
+                break
+            self.last_result = item[1]
+
+        # Один цикл after() на всю отрисовку: больше одного обновления GUI в очереди Tk не бывает
+        frame_id, frame, skipped, captured_at = self.frame_slot.peek(self.render_frame_id)
+        if frame is not None:
+            started = time.perf_counter()
+            self.render_frame_id = frame_id
+            self.stats.increment("render_dropped", skipped)
+            self.stats.increment("rendered")
+
+            # Подгоняем под фактический размер рамки видео, а не под фиксированные 700x500
+            bound_w = self.video_frame.winfo_width()
+            bound_h = self.video_frame.winfo_height()
+            if bound_w < 50 or bound_h < 50:
+                bound_w, bound_h = 700, 500
+            size = self.display.fit(frame.shape[1], frame.shape[0], bound_w, bound_h)
+
+            photo = self.display.render(frame, size, self.draw_result)
+            if self.video_label.cget("image") != str(photo):
+                self.video_label.config(image=photo)
+                self.video_label.imgtk = photo
 
             # Обновляем GUI
-            self.root.after(0, self.update_gui, imgtk)
+            self.update_gui()
 
-            time.sleep(0.05)  # ~20 FPS
+            now = time.perf_counter()
+            self.metrics.tick()
+            self.stats.observe("render", now - started)
+            self.stats.observe("frame_to_screen", now - captured_at)
 
-    def update_gui(self, imgtk):
-        self.video_label.imgtk = imgtk
-        self.video_label.config(image=imgtk)
+        self.root.after(self.render_interval_ms, self.render_frame)
 
+    def draw_result(self, image, scale_x, scale_y):
+        """Рисует рамку последнего результата анализа прямо в буфер отрисовки"""
+        if self.metrics_overlay:
+            self.metrics.draw_overlay(image)
+
+        result = self.last_result
+        if result and "region" in result:
+            region = result["region"]
+            x, y = int(region["x"] * scale_x), int(region["y"] * scale_y)
+            w, h = int(region["w"] * scale_x), int(region["h"] * scale_y)
+            cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            cv2.putText(image, result["dominant_emotion"], (x, y - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+
+    def update_gui(self):
         # Обновляем результат
         if self.current_emotion in self.emotion_dict:
             emotion_text = self.emotion_dict[self.current_emotion]
         else:
             emotion_text = self.current_emotion
 
-        self.result_label.config(text=f"Эмоция: {emotion_text}")
-
         if self.current_confidence > 0:
-            self.confidence_label.config(text=f"Уверенность: {self.current_confidence:.1f}%")
+            confidence_text = f"Уверенность: {self.current_confidence:.1f}%"
         else:
-            self.confidence_label.config(text="Уверенность: —")
+            confidence_text = "Уверенность: —"
+
+        # Перенастраиваем метки только при изменении текста
+        texts = (f"Эмоция: {emotion_text}", confidence_text)
+        if texts != self.shown_texts:
+            self.result_label.config(text=texts[0])
+            self.confidence_label.config(text=texts[1])
+            self.shown_texts = texts
+
+    def get_pipeline_stats(self):
+        """Снимок счетчиков конвейера (кадры захвачены/проанализированы/отброшены)"""
+        stats = self.stats.snapshot()
+        stats["capture_overwritten"] = self.frame_slot.overwritten
+        stats["results_dropped"] = self.result_queue.dropped
+        stats["display_allocations"] = self.display.allocations
+        stats.update(self.face_analyzer.stats)
+        stats.update(self.scene_gate.stats)
+        if self.emotion_cache is not None:
+            stats.update(self.emotion_cache.stats)
+        if self.process_pool is not None:
+            stats.update(self.process_pool.stats)
+        if self.emotion_log is not None:
+            stats.update(self.emotion_log.stats)
+        return stats
 
     def stop_camera(self):
         self.is_running = False
+        if self.capture_thread:
+            # Дожидаемся выхода из cap.read(), чтобы не освобождать камеру под читающим потоком
+            self.capture_thread.join(timeout=1.0)
+            self.capture_thread = None
         if self.cap:
             self.cap.release()
+            self.cap = None
+        if self.stats:
+            print(f"Статистика конвейера: {self.get_pipeline_stats()}")
         self.start_btn.config(state=tk.NORMAL)
         self.stop_btn.config(state=tk.DISABLED)
         self.video_label.config(image='', text="Камера остановлена", bg="gray")
+        self.shown_texts = None
         self.result_label.config(text="Эмоция: —")
         self.confidence_label.config(text="Уверенность: —")
 
     def on_closing(self):
         self.stop_camera()
+        if self.inference_thread:
+            self.inference_thread.join(timeout=1.0)
+        if self.process_pool is not None:
+            self.process_pool.close()
+        if self.emotion_log is not None:
+            self.emotion_log.close()
+            averages = self.emotion_log.aggregates.averages()
+            if averages:
+                print(f"Средние оценки эмоций за сессию: {averages}")
         self.root.destroy()
 
 
+def iter_media(path, frame_step=1):
+    """Кадры из видеофайла или папки с изображениями: (источник, номер, время, кадр)"""
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path)
+                       if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+        for index, name in enumerate(names[::frame_step]):
+            frame = cv2.imread(os.path.join(path, name))
+            if frame is not None:
+                yield name, index * frame_step, None, frame
+        return
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Не удалось открыть видео: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0
+    index = 0
+    try:
+        while True:
+            # Пропускаемые кадры только захватываем, без декодирования
+            if index % frame_step:
+                if not cap.grab():
+                    break
+            else:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield os.path.basename(path), index, index / fps if fps else None, frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def decode_in_background(path, frame_step, batch_size, max_pending=4):
+    """Декодирует кадры в фоновом потоке и отдает их пачками через ограниченную очередь"""
+    batches = queue.Queue(maxsize=max_pending)
+    done = object()
+    errors = []
+
+    def worker():
+        batch = []
+        try:
+            for item in iter_media(path, frame_step):
+                batch.append(item)
+                if len(batch) == batch_size:
+                    batches.put(batch)
+                    batch = []
+            if batch:
+                batches.put(batch)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            batches.put(done)
+
+    threading.Thread(target=worker, daemon=True).start()
+    while True:
+        batch = batches.get()
+        if batch is done:
+            break
+        yield batch
+    if errors:
+        raise errors[0]
+
+
+_batch_analyzer = None
+
+
+def _init_batch_worker(detector_backend, detect_scale=1.0):
+    global _batch_analyzer
+    _batch_analyzer = EmotionAnalyzer(detector_backend, detect_scale).load()
+
+
+def _analyze_batch_items(batch):
+    results = _batch_analyzer.analyze_batch([item[3] for item in batch])
+    return [(source, index, timestamp, faces)
+            for (source, index, timestamp, _), faces in zip(batch, results)]
+
+
+class ResultWriter:
+    """Потоковая запись результатов по кадрам в JSONL или CSV"""
+
+    CSV_FIELDS = ["source", "frame", "timestamp", "face", "x", "y", "w", "h",
+                  "dominant_emotion"] + EMOTION_LABELS
+
+    def __init__(self, path):
+        self.file = open(path, "w", newline="", encoding="utf-8") if path else sys.stdout
+        self.csv = None
+        if path and path.lower().endswith(".csv"):
+            self.csv = csv.DictWriter(self.file, fieldnames=self.CSV_FIELDS)
+            self.csv.writeheader()
+
+    def write(self, source, index, timestamp, faces):
+        if self.csv is None:
+            record = {"source": source, "frame": index, "timestamp": timestamp, "faces": faces}
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            return
+        for face_index, face in enumerate(faces):
+            row = {"source": source, "frame": index, "timestamp": timestamp,
+                   "face": face_index, "dominant_emotion": face["dominant_emotion"]}
+            row.update(face["region"])
+            row.update({label: round(face["emotion"][label], 4) for label in EMOTION_LABELS})
+            self.csv.writerow(row)
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+        else:
+            self.file.flush()
+
+
+def run_batch(path, output=None, batch_size=16, workers=1, frame_step=1,
+              detector_backend='opencv', detect_scale=1.0):
+    """Офлайн-анализ эмоций по видеофайлу или папке с изображениями без GUI"""
+    writer = ResultWriter(output)
+    batches = decode_in_background(path, frame_step, batch_size, max_pending=2 * workers + 2)
+    frames = faces = 0
+    started = time.perf_counter()
+
+    if workers > 1:
+        # spawn: в родителе уже импортирован TensorFlow (и мог пройти замер детекторов), fork небезопасен
+        pool = multiprocessing.get_context("spawn").Pool(workers, initializer=_init_batch_worker,
+                                                         initargs=(detector_backend, detect_scale))
+        results = pool.imap(_analyze_batch_items, batches)
+    else:
+        pool = None
+        _init_batch_worker(detector_backend, detect_scale)
+        results = map(_analyze_batch_items, batches)
+
+    try:
+        for batch_results in results:
+            for source, index, timestamp, frame_faces in batch_results:
+                writer.write(source, index, timestamp, frame_faces)
+                frames += 1
+                faces += len(frame_faces)
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    elapsed = time.perf_counter() - started
+    print(f"Обработано кадров: {frames}, лиц: {faces}, "
+          f"{frames / elapsed if elapsed else 0:.1f} кадров/с", file=sys.stderr)
+    return frames
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Распознавание эмоций")
+    parser.add_argument("--batch", metavar="PATH",
+                        help="офлайн-анализ видеофайла или папки с изображениями без GUI")
+    parser.add_argument("--output", help="файл результатов (.jsonl или .csv), по умолчанию stdout")
+    parser.add_argument("--batch-size", type=int, default=16, help="кадров в одной пачке")
+    parser.add_argument("--workers", type=int, default=1, help="число процессов анализа")
+    parser.add_argument("--frame-step", type=int, default=1, help="анализировать каждый N-й кадр")
+    parser.add_argument("--startup-report", metavar="PATH",
+                        help="дописывать профиль холодного старта в JSONL-файл")
+    parser.add_argument("--cache-threshold", type=int, default=6,
+                        help="порог Хэмминга (0-64) для повторного использования эмоций "
+                             "похожего кропа; -1 отключает кэш")
+    parser.add_argument("--inference-processes", type=int, default=0,
+                        help="анализировать эмоции в N отдельных процессах (0 - в потоке)")
+    parser.add_argument("--min-interval", type=float, default=0.2,
+                        help="минимальный интервал между анализами эмоций, с")
+    parser.add_argument("--max-interval", type=float, default=2.0,
+                        help="максимальный интервал между анализами в статичной сцене, с")
+    parser.add_argument("--motion-threshold", type=float, default=0.01,
+                        help="доля изменившихся пикселей уменьшенного кадра, с которой сцена "
+                             "считается изменившейся; 0 - анализировать с минимальным интервалом")
+    parser.add_argument("--detector", default="auto", choices=["auto"] + DETECTOR_BACKENDS,
+                        help="детектор лиц DeepFace; auto - выбранный --benchmark-detectors на этой машине, "
+                             f"без замера - {DEFAULT_DETECTOR}")
+    parser.add_argument("--detector-min-rate", type=float, default=0.9,
+                        help="минимальная доля кадров с найденным лицом для автовыбора детектора")
+    parser.add_argument("--detector-sample", metavar="PATH",
+                        help="видео или папка с лицами для --benchmark-detectors (по умолчанию --source "
+                             "или --batch)")
+    parser.add_argument("--detect-scale", type=float, default=0.5,
+                        help="масштаб копии кадра для детекции лиц (1 - полный кадр); "
+                             "эмоции всегда считаются по кропу полного разрешения")
+    parser.add_argument("--benchmark-detectors", action="store_true",
+                        help="замерить все детекторы (веса скачиваются), сохранить самый быстрый "
+                             "из прошедших --detector-min-rate и выйти")
+    parser.add_argument("--emotion-log", metavar="DIR",
+                        help="писать время, рамку и все оценки эмоций в журнал по кускам "
+                             "(сводка: python emotion_log.py DIR)")
+    add_metrics_arguments(parser)
+    add_source_argument(parser)
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.benchmark_detectors:
+        # Кадры для замера: явный образец, входные данные пакетного режима или источник
+        sample_spec = args.detector_sample or args.batch or args.source
+        resolve_detector_backend("auto", lambda: sample_frames(sample_spec), args.detector_min_rate,
+                                 args.detect_scale, benchmark=True)
+        sys.exit(0)
+
+    if args.batch:
+        detector = resolve_detector_backend(args.detector, min_detection_rate=args.detector_min_rate,
+                                            detect_scale=args.detect_scale)
+        run_batch(args.batch, args.output, args.batch_size, args.workers, args.frame_step, detector,
+                  args.detect_scale)
+        sys.exit(0)
+
     print("Запуск программы...")
     print("Первый запуск займет время для загрузки моделей")
 
+    profiler = StartupProfiler(_import_started, IMPORT_SECONDS)
+    metrics, exporter = metrics_from_args(args, "face")
     root = tk.Tk()
-    app = EmotionCameraApp(root)
+    app = EmotionCameraApp(root, profiler, args.startup_report, args.cache_threshold,
+                           args.inference_processes, metrics, args.metrics_overlay, source=args.source,
+                           emotion_log=args.emotion_log, min_interval=args.min_interval,
+                           max_interval=args.max_interval, motion_threshold=args.motion_threshold,
+                           detector=args.detector, detector_min_rate=args.detector_min_rate,
+                           detect_scale=args.detect_scale)
     root.mainloop()
+    if exporter:
+        exporter.stop()
@@ -0,0 +1,282 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+# cv2 импортируется в месте использования: модуль подключают до показа окна (knb.py),
+# а OpenCV нужен только при открытии источника
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp"}
+
+
+class FrameSource:
+    """Источник кадров с интерфейсом cv2.VideoCapture: isOpened(), read(), release()"""
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+
+class WebcamSource(FrameSource):
+    """Веб-камера с настройками на низкую задержку: MJPG, буфер драйвера на 1 кадр,
+    сброс накопившихся кадров через grab() перед retrieve()"""
+
+    def __init__(self, index=0, width=640, height=480, fourcc="MJPG", buffer_size=1, drain=True):
+        import cv2
+
+        self.cap = cv2.VideoCapture(index)
+        self.drain = drain
+        if not self.cap.isOpened():
+            return
+
+        # MJPG снимает ограничение пропускной способности сырого YUYV на USB
+        if fourcc:
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        # Поддерживается не всеми бэкендами; тогда выручает drain
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 30
+        self.frame_interval = 1.0 / fps
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        if not self.drain:
+            return self.cap.read()
+
+        # Кадры, лежащие в буфере, grab() отдает мгновенно; ждать пришлось - значит кадр свежий
+        for _ in range(5):
+            started = time.perf_counter()
+            if not self.cap.grab():
+                return False, None
+            if time.perf_counter() - started > self.frame_interval / 2:
+                break
+        return self.cap.retrieve()
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+    """Видеофайл; в режиме realtime кадры отдаются с частотой записи"""
+
+    def __init__(self, path, realtime=True, loop=False):
+        import cv2
+
+        self.cap = cv2.VideoCapture(path)
+        self.realtime = realtime
+        self.loop = loop
+        fps = self.cap.get(cv2.CAP_PROP_FPS) if self.cap.isOpened() else 0
+        self.frame_interval = 1.0 / fps if fps else 1.0 / 30
+        self.next_time = None
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            import cv2
+
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if ret and self.realtime:
+            self.next_time = _pace(self.next_time, self.frame_interval)
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirSource(FrameSource):
+    """Папка с изображениями, отдаваемыми по кругу с заданной частотой"""
+
+    def __init__(self, path, fps=10, loop=True):
+        self.paths = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                      if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS]
+        self.frame_interval = 1.0 / fps if fps else 0
+        self.loop = loop
+        self.index = 0
+        self.next_time = None
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def read(self):
+        if self.index >= len(self.paths):
+            if not self.loop or not self.paths:
+                return False, None
+            self.index = 0
+        import cv2
+
+        frame = cv2.imread(self.paths[self.index])
+        self.index += 1
+        if self.frame_interval:
+            self.next_time = _pace(self.next_time, self.frame_interval)
+        return frame is not None, frame
+
+
+def load_video(path, limit=None):
+    """Декодирует видео целиком заранее, чтобы декодирование не попадало в замеры"""
+    import cv2
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise IOError(f"Не удалось открыть видео: {path}")
+    frames = []
+    while limit is None or len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def synthetic_frames(count, width=640, height=480, seed=0):
+    """Детерминированные кадры: размытый шумовой фон и движущийся овал телесного цвета"""
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    background = (rng.random((height, width, 3)) * 255).astype(np.uint8)
+    background = cv2.GaussianBlur(background, (0, 0), 5)
+
+    frames = []
+    for i in range(count):
+        frame = background.copy()
+        phase = 2 * np.pi * i / 120
+        center = (int(width / 2 + width / 5 * np.sin(phase)), int(height / 2 + height / 8 * np.cos(phase)))
+        cv2.ellipse(frame, center, (70, 90), 0, 0, 360, (120, 160, 210), -1)
+        cv2.circle(frame, (center[0] - 25, center[1] - 20), 8, (40, 40, 40), -1)
+        cv2.circle(frame, (center[0] + 25, center[1] - 20), 8, (40, 40, 40), -1)
+        frames.append(frame)
+    return frames
+
+
+class SyntheticSource(FrameSource):
+    """Синтетические кадры для запуска без камеры (цикл из 120 кадров)"""
+
+    def __init__(self, width=640, height=480, fps=30, seed=0):
+        self.frames = synthetic_frames(120, width, height, seed)
+        self.frame_interval = 1.0 / fps if fps else 0
+        self.index = 0
+        self.next_time = None
+
+    def read(self):
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        if self.frame_interval:
+            self.next_time = _pace(self.next_time, self.frame_interval)
+        # Копия: потребители рисуют поверх кадра
+        return True, frame.copy()
+
+
+def _pace(next_time, interval):
+    """Выдерживает частоту кадров; возвращает время следующего кадра"""
+    now = time.perf_counter()
+    if next_time is None or next_time < now - interval:
+        return now + interval
+    time.sleep(max(next_time - now, 0))
+    return next_time + interval
+
+
+class LatestFrameReader(FrameSource):
+    """Фоновый поток читает источник без остановки; read() всегда отдает самый свежий кадр"""
+
+    def __init__(self, source, timeout=1.0, on_frame=None):
+        self.source = source
+        self.timeout = timeout
+        self.on_frame = on_frame  # вызывается из фонового потока после каждого нового кадра
+        self._cond = threading.Condition()
+        self._frame = None
+        self._frame_id = 0
+        self._read_id = 0
+        self._running = source.isOpened()
+        self.dropped = 0  # кадры, которые так никто и не прочитал
+        if self._running:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def isOpened(self):
+        return self.source.isOpened()
+
+    def _run(self):
+        while self._running:
+            ret, frame = self.source.read()
+            with self._cond:
+                if not ret:
+                    self._running = False
+                    self._cond.notify_all()
+                    break
+                if self._frame_id > self._read_id:
+                    self.dropped += 1
+                self._frame = frame
+                self._frame_id += 1
+                self._cond.notify_all()
+            if self.on_frame is not None:
+                self.on_frame()
+        if self.on_frame is not None:
+            self.on_frame()  # источник закончился - ожидающие тоже должны проснуться
+
+    def has_frame(self):
+        """Есть ли кадр, который еще не отдавали (не блокирует)"""
+        with self._cond:
+            return self._frame_id > self._read_id
+
+    def exhausted(self):
+        """Источник закончился и все его кадры уже прочитаны"""
+        with self._cond:
+            return not self._running and self._frame_id == self._read_id
+
+    def read(self):
+        """Ждет кадр новее последнего отданного; (False, None), если источник закончился"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._frame_id > self._read_id or not self._running,
+                                self.timeout)
+            if self._frame_id == self._read_id:
+                return False, None
+            self._read_id = self._frame_id
+            return True, self._frame
+
+    def release(self):
+        self._running = False
+        thread = getattr(self, "_thread", None)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=self.timeout)
+        self.source.release()
+
+
+def open_source(spec="0", width=640, height=480, threaded=True):
+    """Источник по строке: номер камеры или webcam:N, synthetic, папка с изображениями, видеофайл"""
+    spec = str(spec)
+    if spec.startswith("webcam:"):
+        spec = spec.split(":", 1)[1]
+
+    if spec.isdigit():
+        source = WebcamSource(int(spec), width, height)
+    elif spec == "synthetic":
+        source = SyntheticSource(width, height)
+    elif spec.startswith("synthetic:"):
+        # synthetic:FPS; synthetic:0 - без ограничения частоты (для замеров пропускной способности)
+        source = SyntheticSource(width, height, fps=float(spec.split(":", 1)[1]))
+    elif os.path.isdir(spec):
+        source = ImageDirSource(spec)
+    else:
+        source = VideoFileSource(spec)
+
+    return LatestFrameReader(source) if threaded else source
+
+
+def add_source_argument(parser):
+    parser.add_argument("--source", default="0",
+                        help="источник кадров: номер камеры (webcam:N), synthetic[:FPS], "
+                             "папка с изображениями или видеофайл")
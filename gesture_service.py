@@ -0,0 +1,415 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from aiohttp import ClientSession, WSMsgType, web
+
+import knb
+from frame_sources import load_video, synthetic_frames
+from metrics import StageMetrics, add_metrics_arguments, metrics_from_args
+
+
+class PoolFull(Exception):
+    """Все места для клиентов заняты, а вытеснить некого"""
+
+
+class _Client:
+    __slots__ = ("slot", "recognizer", "http", "busy", "last_seen")
+
+    def __init__(self, slot, http):
+        self.slot = slot
+        self.recognizer = None  # создается потоком экземпляра на первом кадре
+        self.http = http
+        self.busy = 0
+        self.last_seen = time.monotonic()
+
+
+class HandsPool:
+    """Потоки распознавания жестов. У каждого клиента свой GestureRecognizer со своим Hands, чтобы трекинг
+    MediaPipe (static_image_mode=False) шел только по его кадрам; клиент закрепляется за одним потоком.
+    Простаивающие HTTP-клиенты вытесняются (LRU с TTL), число клиентов ограничено max_clients"""
+
+    def __init__(self, size=2, gesture_classifier=None, latency_budget_ms=None, metrics=None,
+                 max_clients=32, client_ttl=60.0):
+        self.metrics = metrics or StageMetrics(enabled=False)
+        self.gesture_classifier = gesture_classifier
+        self.latency_budget_ms = latency_budget_ms
+        self.max_clients = max_clients
+        self.client_ttl = client_ttl
+        # Один поток на экземпляр: кадры его клиентов идут строго по очереди
+        self.executors = [ThreadPoolExecutor(1, thread_name_prefix=f"hands-{i}") for i in range(size)]
+        self.load = [0] * size  # клиентов на поток
+        self.clients = OrderedDict()  # клиент -> _Client, от давно не обращавшихся к недавним
+        self.stats = {"frames": 0, "no_hand": 0, "evicted": 0, "rejected": 0}
+
+    def attach(self, client_id, http=False):
+        """Закрепляет клиента за наименее загруженным потоком (повторный вызов - тот же).
+        PoolFull, если клиентов max_clients и ни один HTTP-клиент не простаивает"""
+        client = self.clients.get(client_id)
+        if client is not None:
+            self.clients.move_to_end(client_id)
+            return client
+
+        self.evict_idle()
+        if len(self.clients) >= self.max_clients:
+            # Освобождаем место за счет HTTP-клиента, дольше всех не присылавшего кадры
+            victim = next((key for key, c in self.clients.items() if c.http and not c.busy), None)
+            if victim is None:
+                self.stats["rejected"] += 1
+                raise PoolFull(f"Занято мест для клиентов: {self.max_clients}")
+            self.detach(victim)
+            self.stats["evicted"] += 1
+
+        slot = min(range(len(self.load)), key=self.load.__getitem__)
+        self.load[slot] += 1
+        client = self.clients[client_id] = _Client(slot, http)
+        return client
+
+    def detach(self, client_id):
+        client = self.clients.pop(client_id, None)
+        if client is None:
+            return
+        self.load[client.slot] -= 1
+        # Закрываем в потоке экземпляра - после кадров клиента, уже стоящих в его очереди
+        self.executors[client.slot].submit(self._close_client, client)
+
+    def evict_idle(self):
+        """Отключает HTTP-клиентов, не присылавших кадры дольше client_ttl"""
+        expired = time.monotonic() - self.client_ttl
+        for client_id, client in list(self.clients.items()):
+            if client.http and not client.busy and client.last_seen <= expired:
+                self.detach(client_id)
+                self.stats["evicted"] += 1
+
+    async def recognize(self, client_id, jpeg, http=False):
+        client = self.attach(client_id, http)
+        client.busy += 1
+        try:
+            loop = asyncio.get_running_loop()
+            reply = await loop.run_in_executor(self.executors[client.slot], self._recognize, client, jpeg)
+        finally:
+            client.busy -= 1
+            client.last_seen = time.monotonic()
+        self.stats["frames"] += 1
+        if reply["gesture"] == "Не обнаружено":
+            self.stats["no_hand"] += 1
+        return reply
+
+    def _recognize(self, client, jpeg):
+        """Выполняется в потоке экземпляра: декодирование JPEG и распознавание"""
+        with self.metrics.stage("decode"):
+            frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("Не удалось декодировать JPEG")
+
+        if client.recognizer is None:
+            client.recognizer = knb.GestureRecognizer(self.gesture_classifier, self.latency_budget_ms,
+                                                      self.metrics)
+        gesture, confidence, finger_count = client.recognizer.recognize_frame(frame)
+        return {"gesture": gesture, "confidence": confidence, "finger_count": finger_count}
+
+    @staticmethod
+    def _close_client(client):
+        if client.recognizer is not None:
+            client.recognizer.close()
+            client.recognizer = None
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats["clients"] = list(self.load)
+        return stats
+
+    def close(self):
+        for client_id in list(self.clients):
+            self.detach(client_id)
+        for executor in self.executors:
+            executor.shutdown(wait=True)
+
+
+class LatestFrame:
+    """Слот на один кадр соединения: новый кадр вытесняет необработанный старый"""
+
+    def __init__(self):
+        self._event = asyncio.Event()
+        self._frame = None
+        self.frame_id = 0
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, frame):
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self.frame_id += 1
+        self._event.set()
+
+    async def get(self):
+        """(номер кадра, JPEG) или None после close()"""
+        await self._event.wait()
+        self._event.clear()
+        if self._frame is None:
+            return None
+        frame, self._frame = self._frame, None
+        return self.frame_id, frame
+
+    def close(self):
+        self.closed = True
+        self._frame = None
+        self._event.set()
+
+
+class GestureService:
+    """HTTP/WebSocket-сервис распознавания жестов без GUI"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.in_flight = set()  # клиенты HTTP с кадром в обработке
+        self.stats = {"http_requests": 0, "http_busy": 0, "ws_connections": 0, "ws_frames": 0,
+                      "ws_dropped": 0, "errors": 0}
+
+    def make_app(self):
+        app = web.Application(client_max_size=8 * 1024 * 1024)
+        app.add_routes([
+            web.post("/recognize", self.handle_recognize),
+            web.get("/ws", self.handle_ws),
+            web.get("/health", self.handle_health),
+        ])
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+    async def _timed_recognize(self, client_id, jpeg, http=False):
+        started = time.perf_counter()
+        reply = await self.pool.recognize(client_id, jpeg, http)
+        elapsed = time.perf_counter() - started
+        self.pool.metrics.record("request", elapsed)
+        reply["latency_ms"] = round(elapsed * 1000, 2)
+        return reply
+
+    async def handle_recognize(self, request):
+        """POST /recognize: тело - JPEG, X-Client-Id - клиент для закрепления за экземпляром Hands"""
+        client_id = "http:" + request.headers.get("X-Client-Id", request.remote or "anonymous")
+        self.stats["http_requests"] += 1
+        # Один кадр в обработке на клиента: остальные отклоняем, а не копим очередь
+        if client_id in self.in_flight:
+            self.stats["http_busy"] += 1
+            return web.json_response({"error": "busy"}, status=429, headers={"Retry-After": "0"})
+
+        self.in_flight.add(client_id)
+        try:
+            jpeg = await request.read()
+            reply = await self._timed_recognize(client_id, jpeg, http=True)
+        except PoolFull as e:
+            return web.json_response({"error": str(e)}, status=503, headers={"Retry-After": "1"})
+        except ValueError as e:
+            self.stats["errors"] += 1
+            return web.json_response({"error": str(e)}, status=400)
+        finally:
+            self.in_flight.discard(client_id)
+        return web.json_response(reply)
+
+    async def handle_ws(self, request):
+        """GET /ws: бинарные сообщения - JPEG-кадры, ответы - JSON на каждый обработанный кадр"""
+        ws = web.WebSocketResponse(max_msg_size=8 * 1024 * 1024)
+        client_id = f"ws:{id(ws)}"
+        try:
+            self.pool.attach(client_id)
+        except PoolFull as e:
+            return web.json_response({"error": str(e)}, status=503, headers={"Retry-After": "1"})
+        await ws.prepare(request)
+        self.stats["ws_connections"] += 1
+
+        latest = LatestFrame()
+        worker = asyncio.create_task(self._ws_worker(ws, client_id, latest))
+        try:
+            async for message in ws:
+                if message.type == WSMsgType.BINARY:
+                    latest.put(message.data)
+                elif message.type == WSMsgType.ERROR:
+                    break
+        finally:
+            latest.close()
+            try:
+                await worker
+            finally:
+                # aiohttp отменяет обработчик при разрыве соединения - клиента отключаем и тогда
+                self.stats["ws_dropped"] += latest.dropped
+                self.pool.detach(client_id)
+        return ws
+
+    async def _ws_worker(self, ws, client_id, latest):
+        while True:
+            item = await latest.get()
+            if item is None:
+                return
+            frame_id, jpeg = item
+            try:
+                reply = await self._timed_recognize(client_id, jpeg)
+            except Exception as e:
+                # Ошибка одного кадра не должна останавливать соединение: клиент ждет ответ
+                self.stats["errors"] += 1
+                reply = {"error": str(e) or type(e).__name__}
+            self.stats["ws_frames"] += 1
+            reply.update(frame_id=frame_id, dropped=latest.dropped)
+            try:
+                await ws.send_str(json.dumps(reply, ensure_ascii=False))
+            except ConnectionResetError:
+                return  # клиент ушел, пока кадр обрабатывался
+
+    async def handle_health(self, request):
+        stages = {name: {"count": s["count"], "p50_ms": round(s["p50"], 2), "p95_ms": round(s["p95"], 2)}
+                  for name, s in self.pool.metrics.summary().items()}
+        return web.json_response({"service": self.stats, "pool": self.pool.snapshot(), "stages": stages})
+
+    async def on_cleanup(self, app):
+        await asyncio.get_running_loop().run_in_executor(None, self.pool.close)
+
+
+def encode_frames(frames, quality=80):
+    return [cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+            for frame in frames]
+
+
+async def _ws_client(url, frames, deadline, fps, latencies, counters):
+    async with ClientSession() as session, session.ws_connect(url + "/ws") as ws:
+        sent_at = {}
+        dropped = [0]
+        index = 0
+
+        async def send(frame_id):
+            sent_at[frame_id] = time.perf_counter()
+            await ws.send_bytes(frames[(frame_id - 1) % len(frames)])
+
+        async def receive():
+            reply = json.loads((await ws.receive()).data)
+            started = sent_at.pop(reply.get("frame_id"), None)
+            if "error" in reply:
+                counters["errors"] += 1
+            elif started is not None:
+                latencies.append(time.perf_counter() - started)
+            # Кадры, вытесненные сервером, ответа не получат
+            for frame_id in [i for i in sent_at if i < reply.get("frame_id", 0)]:
+                del sent_at[frame_id]
+            # Счетчик вытесненных кадров на сервере - накопительный по соединению
+            counters["dropped"] += reply.get("dropped", 0) - dropped[0]
+            dropped[0] = reply.get("dropped", 0)
+
+        if not fps:
+            # Замкнутый цикл: следующий кадр - после ответа на предыдущий
+            while time.perf_counter() < deadline:
+                index += 1
+                await send(index)
+                await receive()
+            return
+
+        # Открытый цикл с заданной частотой: проверяет вытеснение кадров на сервере
+        async def receiver():
+            while True:
+                await receive()
+
+        receiving = asyncio.create_task(receiver())
+        next_time = time.perf_counter()
+        while time.perf_counter() < deadline:
+            index += 1
+            await send(index)
+            next_time += 1.0 / fps
+            await asyncio.sleep(max(next_time - time.perf_counter(), 0))
+        await asyncio.sleep(0.5)
+        receiving.cancel()
+
+
+async def _http_client(url, client_id, frames, deadline, latencies, counters):
+    headers = {"X-Client-Id": client_id, "Content-Type": "image/jpeg"}
+    async with ClientSession() as session:
+        index = 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            async with session.post(url + "/recognize", data=frames[index % len(frames)],
+                                    headers=headers) as response:
+                await response.read()
+                if response.status == 429:
+                    counters["busy"] += 1
+                elif response.status != 200:
+                    counters["errors"] += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+            index += 1
+
+
+async def run_loadgen(url, frames, clients=4, duration=10.0, mode="ws", fps=None):
+    """Нагрузка из clients параллельных клиентов; возвращает запросы/с и перцентили задержки"""
+    latencies = []
+    counters = {"errors": 0, "busy": 0, "dropped": 0}
+    started = time.perf_counter()
+    deadline = started + duration
+    if mode == "ws":
+        tasks = [_ws_client(url, frames, deadline, fps, latencies, counters) for _ in range(clients)]
+    else:
+        tasks = [_http_client(url, f"loadgen-{i}", frames, deadline, latencies, counters)
+                 for i in range(clients)]
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    report = {"mode": mode, "clients": clients, "requests": len(latencies),
+              "requests_per_s": round(len(latencies) / elapsed, 2), **counters}
+    if latencies:
+        values = np.array(latencies) * 1000
+        p50, p95, p99 = np.percentile(values, (50, 95, 99))
+        report.update(p50_ms=round(float(p50), 2), p95_ms=round(float(p95), 2), p99_ms=round(float(p99), 2))
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Сервис распознавания жестов без GUI (HTTP/WebSocket)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="запустить сервис")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--pool", type=int, default=2, help="число потоков распознавания")
+    serve.add_argument("--gesture-model", help="обученный классификатор жестов (.npz) вместо правил")
+    serve.add_argument("--latency-budget-ms", type=float,
+                       help="бюджет времени на кадр: включает ROI и адаптивную сложность модели")
+    serve.add_argument("--max-clients", type=int, default=32,
+                       help="одновременных клиентов (у каждого свой MediaPipe Hands)")
+    serve.add_argument("--client-ttl", type=float, default=60.0,
+                       help="через сколько секунд без кадров отключать HTTP-клиента")
+    add_metrics_arguments(serve)
+
+    loadgen = commands.add_parser("loadgen", help="локальный генератор нагрузки")
+    loadgen.add_argument("--url", default="http://127.0.0.1:8080")
+    loadgen.add_argument("--mode", choices=("ws", "http"), default="ws")
+    loadgen.add_argument("--clients", type=int, default=4)
+    loadgen.add_argument("--duration", type=float, default=10.0, help="длительность, с")
+    loadgen.add_argument("--fps", type=float,
+                         help="отправлять кадры с этой частотой, не дожидаясь ответов (только ws)")
+    loadgen.add_argument("--video", help="видео с руками вместо синтетических кадров")
+    loadgen.add_argument("--frames", type=int, default=120, help="число кадров (для видео - максимум)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "loadgen":
+        frames = load_video(args.video, args.frames) if args.video else synthetic_frames(args.frames)
+        report = asyncio.run(run_loadgen(args.url.rstrip("/"), encode_frames(frames), args.clients,
+                                         args.duration, args.mode, args.fps))
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        sys.exit(0)
+
+    metrics, exporter = metrics_from_args(args, "gesture_service")
+    # Задержки стадий нужны /health даже без флагов метрик
+    metrics.enabled = True
+    classifier = knb.GestureClassifier.load(args.gesture_model) if args.gesture_model else None
+    pool = HandsPool(args.pool, classifier, args.latency_budget_ms, metrics, args.max_clients,
+                     args.client_ttl)
+    try:
+        web.run_app(GestureService(pool).make_app(), host=args.host, port=args.port)
+    finally:
+        if exporter:
+            exporter.stop()
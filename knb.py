@@ -1,32 +1,609 @@
+import time
+
+_import_started = time.perf_counter()
+
 import tkinter as tk
 from tkinter import messagebox, font
-import cv2
-from PIL import Image, ImageTk
 import numpy as np
-import time
 import threading
-import random
-import mediapipe as mp
+import argparse
+import dataclasses
+import os
+
+from frame_sources import add_source_argument, open_source
+from landmark_stream import LandmarkStreamWriter
+from metrics import StageMetrics, StartupProfiler, add_metrics_arguments, metrics_from_args
+from tournament import STRATEGIES, LiveOpponent, judge_round, make_strategy
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
+# OpenCV, Pillow и MediaPipe импортирует load_vision_modules: окно игры показывается сразу,
+# а импорт MediaPipe (секунды) идет в фоновом потоке
+cv2 = None
+Image = None
+ImageTk = None
+mp = None
+_vision_lock = threading.Lock()
+
+
+def load_vision_modules(profiler=None):
+    """Импортирует OpenCV, Pillow и MediaPipe при первом вызове; повторный вызов ничего не стоит"""
+    global cv2, Image, ImageTk, mp
+    if mp is not None:
+        return
+    profiler = profiler or StartupProfiler()
+    with _vision_lock:
+        if mp is not None:
+            return
+        with profiler.measure("import_cv2"):
+            import cv2
+            from PIL import Image, ImageTk
+        with profiler.measure("import_mediapipe"):
+            import mediapipe as mp
+
+
+# Индексы ключевых точек MediaPipe Hands по пальцам: большой, указательный, средний, безымянный, мизинец
+WRIST = 0
+MIDDLE_MCP = 9
+FINGER_TIPS = np.array([4, 8, 12, 16, 20])
+FINGER_PIPS = np.array([3, 6, 10, 14, 18])  # для большого пальца - IP
+FINGER_MCPS = np.array([2, 5, 9, 13, 17])
+
+GESTURES = ["Камень", "Ножницы", "Бумага", "Неизвестно"]
+# Уверенность правил: камень, ножницы, бумага, 2 пальца не те, прочее
+RULE_CONFIDENCE = {"rock": 95, "scissors": 90, "paper": 85, "unknown_two": 50, "unknown": 60}
+
+
+def landmarks_to_array(landmarks, out=None):
+    """Ключевые точки MediaPipe -> массив (21, 3) float32 за один проход"""
+    if out is None:
+        out = np.empty((21, 3), dtype=np.float32)
+    out.ravel()[:] = [c for p in landmarks for c in (p.x, p.y, p.z)]
+    return out
+
+
+def fingers_up(points):
+    """Поднятые пальцы (..., 5) по массиву точек (..., 21, 3)"""
+    up = points[..., FINGER_TIPS, 1] < points[..., FINGER_PIPS, 1]
+    # Большой палец: кончик выше IP и заметно отведен в сторону
+    up[..., 0] &= np.abs(points[..., 4, 0] - points[..., 3, 0]) > 0.05
+    return up
+
+
+def hand_features(points):
+    """Вектор признаков (..., 15): поднятые пальцы, углы в PIP-суставах (градусы),
+    расстояния кончиков до запястья в размерах ладони"""
+    xy = points[..., :2]
+    pips = xy[..., FINGER_PIPS, :]
+    to_mcp = xy[..., FINGER_MCPS, :] - pips
+    to_tip = xy[..., FINGER_TIPS, :] - pips
+    to_wrist = xy[..., FINGER_TIPS, :] - xy[..., WRIST:WRIST + 1, :]
+    palm = xy[..., MIDDLE_MCP, :] - xy[..., WRIST, :]
+
+    norms = np.sqrt((to_mcp * to_mcp).sum(-1) * (to_tip * to_tip).sum(-1))
+    cosine = (to_mcp * to_tip).sum(-1) / np.maximum(norms, 1e-6)
+    angles = np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+
+    palm_size = np.sqrt((palm * palm).sum(-1))[..., np.newaxis]
+    tip_dist = np.sqrt((to_wrist * to_wrist).sum(-1)) / np.maximum(palm_size, 1e-6)
+
+    return np.concatenate([fingers_up(points).astype(np.float32), angles, tip_dist], axis=-1)
+
+
+# Плоские индексы y-координат кончиков и PIP для массива (21, 3)
+_TIP_PIP_Y = np.concatenate([FINGER_TIPS, FINGER_PIPS]) * 3 + 1
+
+
+def classify_hand(points):
+    """Жест, уверенность и число поднятых пальцев для одного массива (21, 3)"""
+    # То же, что fingers_up, но одной выборкой: на одном кадре накладные расходы NumPy важнее
+    y = points.ravel().take(_TIP_PIP_Y)
+    up = (y[:5] < y[5:]).tolist()
+    up[0] = up[0] and abs(float(points[4, 0] - points[3, 0])) > 0.05
+    count = sum(up)
+
+    # Определяем жест по количеству поднятых пальцев
+    if count == 0:
+        return GESTURES[0], RULE_CONFIDENCE["rock"], count
+    if count == 2:
+        # Ножницы - подняты именно указательный и средний
+        if up[1] and up[2] and not up[3] and not up[4]:
+            return GESTURES[1], RULE_CONFIDENCE["scissors"], count
+        return GESTURES[3], RULE_CONFIDENCE["unknown_two"], count
+    if count >= 4:
+        return GESTURES[2], RULE_CONFIDENCE["paper"], count
+    return GESTURES[3], RULE_CONFIDENCE["unknown"], count
+
+
+def classify_hands(points):
+    """classify_hand для пачки (N, 21, 3): индексы в GESTURES, уверенности и число пальцев"""
+    up = fingers_up(points)
+    count = up.sum(axis=-1)
+    scissors = up[:, 1] & up[:, 2] & ~up[:, 3] & ~up[:, 4]
+
+    gestures = np.full(len(count), 3, dtype=np.int8)
+    confidence = np.full(len(count), RULE_CONFIDENCE["unknown"], dtype=np.int8)
+    for mask, gesture, key in ((count == 0, 0, "rock"), ((count == 2) & scissors, 1, "scissors"),
+                               ((count == 2) & ~scissors, 3, "unknown_two"), (count >= 4, 2, "paper")):
+        gestures[mask] = gesture
+        confidence[mask] = RULE_CONFIDENCE[key]
+    return gestures, confidence, count
+
+
+def normalize_landmarks(points):
+    """Нормализация (..., 21, 3): запястье в начале координат, ладонь повернута «вверх»,
+    масштаб - расстояние от запястья до основания среднего пальца"""
+    centered = points - points[..., WRIST:WRIST + 1, :]
+    axis = centered[..., MIDDLE_MCP, :2]
+    size = np.maximum(np.sqrt((axis * axis).sum(-1)), 1e-6)[..., np.newaxis]
+
+    # Поворот, переводящий ось ладони в направление (0, -1) - вверх в координатах кадра
+    angle = np.arctan2(axis[..., 0], -axis[..., 1])[..., np.newaxis]
+    cos, sin = np.cos(angle), np.sin(angle)
+    x, y = centered[..., 0], centered[..., 1]
+
+    normalized = np.empty_like(centered)
+    normalized[..., 0] = x * cos + y * sin
+    normalized[..., 1] = y * cos - x * sin
+    normalized[..., 2] = centered[..., 2]
+    return normalized / size[..., np.newaxis]
+
+
+class GestureClassifier:
+    """Многоклассовая логистическая регрессия на NumPy по нормализованным точкам руки"""
+
+    LABELS = GESTURES[:3]
+
+    def __init__(self, weights=None, bias=None, mean=None, std=None, min_probability=0.6):
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.std = std
+        self.min_probability = min_probability  # ниже - жест считается неизвестным
+
+    @staticmethod
+    def features(normalized):
+        """Признаки по нормализованным точкам: координаты x, y и вектор hand_features"""
+        flat = normalized[..., :2].reshape(normalized.shape[:-2] + (42,))
+        return np.concatenate([flat, hand_features(normalized)], axis=-1).astype(np.float32)
+
+    def fit(self, normalized, labels, epochs=500, learning_rate=0.5, l2=1e-3):
+        """Обучение полным градиентным спуском; labels - индексы в LABELS"""
+        x = self.features(normalized)
+        self.mean = x.mean(axis=0)
+        self.std = x.std(axis=0) + 1e-6
+        x = (x - self.mean) / self.std
+        targets = np.eye(len(self.LABELS), dtype=np.float32)[labels]
+
+        self.weights = np.zeros((x.shape[1], len(self.LABELS)), dtype=np.float32)
+        self.bias = np.zeros(len(self.LABELS), dtype=np.float32)
+        for _ in range(epochs):
+            error = (self._softmax(x @ self.weights + self.bias) - targets) / len(x)
+            self.weights -= learning_rate * (x.T @ error + l2 * self.weights)
+            self.bias -= learning_rate * error.sum(axis=0)
+        return self
+
+    @staticmethod
+    def _softmax(logits):
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def predict_proba(self, normalized):
+        x = (self.features(normalized) - self.mean) / self.std
+        return self._softmax(x @ self.weights + self.bias)
+
+    def classify(self, points):
+        """Тот же результат, что у classify_hand: (жест, уверенность %, число пальцев)"""
+        normalized = normalize_landmarks(points)
+        probabilities = self.predict_proba(normalized)
+        best = int(probabilities.argmax())
+        confidence = int(round(float(probabilities[best]) * 100))
+        finger_count = int(fingers_up(points).sum())
+        if probabilities[best] < self.min_probability:
+            return GESTURES[3], confidence, finger_count
+        return self.LABELS[best], confidence, finger_count
+
+    def classify_batch(self, points):
+        """classify для пачки (N, 21, 3): индексы в GESTURES, уверенности и число пальцев"""
+        probabilities = self.predict_proba(normalize_landmarks(points))
+        best = probabilities.argmax(axis=-1)
+        top = probabilities[np.arange(len(best)), best]
+        gestures = np.where(top < self.min_probability, 3, best).astype(np.int8)
+        confidence = np.rint(top * 100).astype(np.int8)
+        return gestures, confidence, fingers_up(points).sum(axis=-1)
+
+    def save(self, path):
+        np.savez(path, weights=self.weights, bias=self.bias, mean=self.mean, std=self.std,
+                 min_probability=self.min_probability)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            # В файлах старых версий порога нет - берем значение по умолчанию
+            extra = {"min_probability": float(data["min_probability"])} if "min_probability" in data else {}
+            return cls(data["weights"], data["bias"], data["mean"], data["std"], **extra)
+
+
+def save_samples(path, samples, labels):
+    """Дописывает нормализованные точки (N, 21, 3) и метки к файлу образцов .npz"""
+    samples = np.asarray(samples, dtype=np.float32)
+    labels = np.asarray(labels, dtype=np.int64)
+    if os.path.exists(path):
+        # Файл закрываем до перезаписи: открытый NpzFile не дает заменить его в Windows
+        with np.load(path) as existing:
+            samples = np.concatenate([existing["samples"], samples])
+            labels = np.concatenate([existing["labels"], labels])
+    np.savez_compressed(path, samples=samples, labels=labels)
+    return len(labels)
+
+
+def train_classifier(samples_path, model_path, holdout=0.2, seed=0):
+    """Обучает GestureClassifier по записанным образцам и печатает точность на отложенной части"""
+    with np.load(samples_path) as data:
+        samples, labels = data["samples"], data["labels"]
+
+    order = np.random.default_rng(seed).permutation(len(labels))
+    split = int(len(order) * (1 - holdout))
+    train, test = order[:split], order[split:]
+
+    classifier = GestureClassifier().fit(samples[train], labels[train])
+    if len(test):
+        predicted = classifier.predict_proba(samples[test]).argmax(axis=-1)
+        print(f"Точность на отложенных образцах: {(predicted == labels[test]).mean():.1%} "
+              f"({len(test)} шт.)")
+    classifier.save(model_path)
+    print(f"Модель сохранена: {model_path}")
+    return classifier
+
+
+class GestureSmoother:
+    """Сглаживание жеста во времени: кольцевой буфер с поддерживаемыми на лету
+    суммами уверенностей по классам, взвешенное голосование и гистерезис"""
+
+    def __init__(self, window=5, min_samples=3, switch_margin=1.2, labels=GESTURES):
+        self.window = window
+        self.min_samples = min_samples  # до стольких кадров жест не сглаживается
+        self.switch_margin = switch_margin  # во сколько раз новый лидер должен обойти текущий
+        self.labels = list(labels)
+        self._index = {label: i for i, label in enumerate(self.labels)}
+        self.reset()
+
+    def reset(self):
+        self._classes = [0] * self.window
+        self._weights = [0] * self.window
+        self._scores = [0] * len(self.labels)
+        self._head = 0
+        self._size = 0
+        self.current = None
+
+    def update(self, gesture, confidence):
+        """Добавляет наблюдение и возвращает сглаженный жест; стоимость не зависит от окна"""
+        index = self._index.get(gesture)
+        if index is None:
+            return gesture
+
+        # Целые веса: суммы при вычитании вышедших из окна кадров не накапливают ошибку
+        weight = max(int(confidence), 1)
+        if self._size == self.window:
+            self._scores[self._classes[self._head]] -= self._weights[self._head]
+        else:
+            self._size += 1
+        self._classes[self._head] = index
+        self._weights[self._head] = weight
+        self._scores[index] += weight
+        self._head = (self._head + 1) % self.window
+
+        if self._size < self.min_samples:
+            return gesture
+
+        scores = self._scores
+        leader = max(range(len(scores)), key=scores.__getitem__)
+        if self.current is None or (leader != self.current and
+                                    scores[leader] >= scores[self.current] * self.switch_margin):
+            self.current = leader
+        return self.labels[self.current]
+
+
+def create_hands(model_complexity=1):
+    """MediaPipe Hands с настройками игры: одна рука, режим отслеживания"""
+    load_vision_modules()
+    return mp.solutions.hands.Hands(
+        static_image_mode=False,
+        max_num_hands=1,  # Распознаем только одну руку
+        min_detection_confidence=0.7,
+        min_tracking_confidence=0.7,
+        model_complexity=model_complexity
+    )
+
+
+def _rgb_drawing_style(style):
+    """Стиль отрисовки MediaPipe (цвета BGR) для рисования в RGB-кадре"""
+    return {key: dataclasses.replace(spec, color=spec.color[::-1]) for key, spec in style.items()}
+
+
+class AdaptiveHandsRunner:
+    """MediaPipe Hands на ROI вокруг последней найденной руки с подстройкой
+    сложности модели и масштаба входа под бюджет времени на кадр"""
+
+    # (model_complexity, масштаб входа) от самого дешевого к самому точному
+    LEVELS = [(0, 0.5), (0, 0.75), (0, 1.0), (1, 0.75), (1, 1.0)]
+
+    def __init__(self, budget_ms=25.0, roi_padding=0.4, min_roi=128, models=None):
+        self.budget_ms = budget_ms
+        self.roi_padding = roi_padding  # запас вокруг руки в долях ее размера
+        self.min_roi = min_roi
+        self.models = dict(models or {})
+        for complexity in {level[0] for level in self.LEVELS}:
+            if complexity not in self.models:
+                self.models[complexity] = create_hands(complexity)
+
+        self.level = len(self.LEVELS) - 1
+        self.avg_ms = None
+        self.frames_at_level = 0
+        self.roi = None
+        self.stats = {"roi_frames": 0, "full_frames": 0, "roi_lost": 0, "level_changes": 0}
+
+    def process(self, image_rgb):
+        """То же, что Hands.process, но координаты точек всегда в системе полного кадра"""
+        started = time.perf_counter()
+        complexity, scale = self.LEVELS[self.level]
+
+        results = None
+        if self.roi is not None:
+            self.stats["roi_frames"] += 1
+            results = self._run(image_rgb, self.roi, complexity, scale)
+            if not results.multi_hand_landmarks:
+                # Рука ушла из ROI - сразу повторяем на полном кадре
+                self.stats["roi_lost"] += 1
+                results = None
+        if results is None:
+            self.stats["full_frames"] += 1
+            results = self._run(image_rgb, None, complexity, scale)
+
+        self.roi = self._roi_from(results, image_rgb.shape)
+        self._adapt((time.perf_counter() - started) * 1000)
+        return results
+
+    def _run(self, image_rgb, roi, complexity, scale):
+        frame_h, frame_w = image_rgb.shape[:2]
+        x0, y0, x1, y1 = roi or (0, 0, frame_w, frame_h)
+        crop = image_rgb[y0:y1, x0:x1]
+        if scale < 1.0:
+            crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        elif roi is not None:
+            crop = np.ascontiguousarray(crop)
+
+        results = self.models[complexity].process(crop)
+
+        # Переводим нормированные координаты ROI в координаты полного кадра
+        if roi is not None and results.multi_hand_landmarks:
+            crop_w, crop_h = x1 - x0, y1 - y0
+            for hand_landmarks in results.multi_hand_landmarks:
+                for landmark in hand_landmarks.landmark:
+                    landmark.x = (x0 + landmark.x * crop_w) / frame_w
+                    landmark.y = (y0 + landmark.y * crop_h) / frame_h
+                    landmark.z = landmark.z * crop_w / frame_w
+        return results
+
+    def _roi_from(self, results, shape):
+        """Квадратная ROI с запасом вокруг первой руки или None"""
+        if not results.multi_hand_landmarks:
+            return None
+        frame_h, frame_w = shape[:2]
+        landmarks = results.multi_hand_landmarks[0].landmark
+        xs = [landmark.x * frame_w for landmark in landmarks]
+        ys = [landmark.y * frame_h for landmark in landmarks]
+
+        size = max(max(xs) - min(xs), max(ys) - min(ys))
+        size = max(size * (1 + 2 * self.roi_padding), self.min_roi)
+        if size >= min(frame_w, frame_h):
+            return None
+        cx, cy = (max(xs) + min(xs)) / 2, (max(ys) + min(ys)) / 2
+
+        x0 = int(min(max(cx - size / 2, 0), frame_w - size))
+        y0 = int(min(max(cy - size / 2, 0), frame_h - size))
+        return x0, y0, x0 + int(size), y0 + int(size)
+
+    def _adapt(self, elapsed_ms):
+        """Переключает уровень, когда скользящее среднее выходит за бюджет"""
+        self.avg_ms = elapsed_ms if self.avg_ms is None else 0.8 * self.avg_ms + 0.2 * elapsed_ms
+        self.frames_at_level += 1
+        if self.frames_at_level < 15:
+            return
+
+        if self.avg_ms > self.budget_ms and self.level > 0:
+            self.level -= 1
+        elif self.avg_ms < self.budget_ms * 0.6 and self.level < len(self.LEVELS) - 1:
+            self.level += 1
+        else:
+            return
+        self.stats["level_changes"] += 1
+        self.frames_at_level = 0
+        self.avg_ms = None
+
+    def close(self):
+        for model in self.models.values():
+            model.close()
+
+
+class GestureRecognizer:
+    """Распознавание жеста по кадру без GUI: MediaPipe Hands и правила или классификатор"""
+
+    def __init__(self, gesture_classifier=None, latency_budget_ms=None, metrics=None, hands=None):
+        self.metrics = metrics or StageMetrics(enabled=False)
+
+        # Инициализация MediaPipe Hands для распознавания
+        load_vision_modules()
+        self.mp_hands = mp.solutions.hands
+        self.hands = hands or create_hands(model_complexity=1)
+
+        # Адаптивный режим: ROI и переключение сложности под бюджет времени на кадр
+        self.hands_runner = None
+        if latency_budget_ms:
+            self.hands_runner = AdaptiveHandsRunner(latency_budget_ms, models={1: self.hands})
+        self.mp_drawing = mp.solutions.drawing_utils
+        self.mp_drawing_styles = mp.solutions.drawing_styles
+        # Стили отрисовки строятся один раз; у MediaPipe цвета BGR, для RGB-кадра переставляем
+        bgr_styles = (self.mp_drawing_styles.get_default_hand_landmarks_style(),
+                      self.mp_drawing_styles.get_default_hand_connections_style())
+        self.drawing_styles = {False: bgr_styles, True: tuple(_rgb_drawing_style(s) for s in bgr_styles)}
+
+        # Распознавание: правила по пальцам или обученный классификатор
+        self.gesture_classifier = gesture_classifier
+        self.landmark_buffer = np.empty((21, 3), dtype=np.float32)  # точки текущего кадра
+
+        # Кадровые буферы переиспользуются между кадрами (пересоздаются при смене размера)
+        self._buffers = {}
+
+    def _buffer(self, name, shape):
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[name] = np.empty(shape, dtype=np.uint8)
+        return buffer
+
+    def warm_up(self, profiler):
+        """Первый инференс на пустом кадре: граф MediaPipe доинициализируется до первого кадра камеры"""
+        with profiler.measure("first_inference"):
+            self.process_hands(np.zeros((480, 640, 3), dtype=np.uint8))
+
+    def process_hands(self, frame):
+        """BGR-кадр -> результат MediaPipe Hands (координаты в системе полного кадра)"""
+        # Конвертируем BGR в RGB в переиспользуемый буфер
+        with self.metrics.stage("color_convert"):
+            image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._buffer("rgb", frame.shape))
+        return self.process_rgb(image_rgb)
+
+    def process_rgb(self, image_rgb):
+        """RGB-кадр -> результат MediaPipe Hands"""
+        image_rgb.flags.writeable = False
+
+        # Обрабатываем кадр
+        with self.metrics.stage("hands_process"):
+            if self.hands_runner is not None:
+                results = self.hands_runner.process(image_rgb)
+            else:
+                results = self.hands.process(image_rgb)
+
+        # Включаем запись обратно
+        image_rgb.flags.writeable = True
+        return results
+
+    def recognize_frame(self, frame):
+        """Жест, уверенность и число пальцев без отрисовки - для сервисов и пакетной обработки"""
+        results = self.process_hands(frame)
+        if not results.multi_hand_landmarks:
+            return "Не обнаружено", 0, 0
+        return self.recognize_gesture(results.multi_hand_landmarks[0].landmark, frame.shape)
+
+    def analyze_frame_with_mediapipe(self, frame):
+        """Анализ кадра с использованием MediaPipe Hands; разметка рисуется на копии BGR-кадра"""
+        results = self.process_hands(frame)
+        processed_frame = frame.copy()
+        return (processed_frame, *self._annotate(processed_frame, results, rgb=False))
+
+    def analyze_frame_rgb(self, frame, mirror=True):
+        """Путь кадра для показа: BGR-кадр камеры один раз отражается и переводится в RGB
+        в переиспользуемый буфер, MediaPipe получает этот же буфер, разметка рисуется прямо в нем.
+        Возвращает буфер (действителен до следующего вызова), жест, уверенность и число пальцев"""
+        image_rgb = self._buffer("display_rgb", frame.shape)
+        with self.metrics.stage("color_convert"):
+            if mirror:
+                cv2.flip(frame, 1, dst=image_rgb)
+                cv2.cvtColor(image_rgb, cv2.COLOR_BGR2RGB, dst=image_rgb)
+            else:
+                cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=image_rgb)
+        results = self.process_rgb(image_rgb)
+        return (image_rgb, *self._annotate(image_rgb, results, rgb=True))
+
+    def _annotate(self, image, results, rgb):
+        """Распознает первую руку и рисует разметку в image; (жест, уверенность, пальцы)"""
+        if not results.multi_hand_landmarks:
+            return "Не обнаружено", 0, 0
+
+        hand_landmarks = results.multi_hand_landmarks[0]  # Обрабатываем только первую руку
+        landmark_style, connection_style = self.drawing_styles[rgb]
+        with self.metrics.stage("draw_landmarks"):
+            self.mp_drawing.draw_landmarks(image, hand_landmarks, self.mp_hands.HAND_CONNECTIONS,
+                                           landmark_style, connection_style)
+
+        # Определяем жест
+        gesture, confidence, finger_count = self.recognize_gesture(hand_landmarks.landmark, image.shape)
+
+        # Отображаем жест на кадре (цвета одинаковы в BGR и RGB)
+        if gesture != "Не обнаружено":
+            cv2.putText(image, f"{gesture} ({confidence}%)",
+                        (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+
+        # Добавляем подсказки
+        cv2.putText(image, "Покажите: Камень ✊, Ножницы ✌️ или Бумага ✋",
+                    (10, image.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        return gesture, confidence, finger_count
+
+    def recognize_gesture(self, landmarks, frame_shape):
+        """Определение жеста по ключевым точкам"""
+        if not isinstance(landmarks, np.ndarray):
+            landmarks = landmarks_to_array(landmarks, self.landmark_buffer)
+        if self.gesture_classifier is not None:
+            return self.gesture_classifier.classify(landmarks)
+        return classify_hand(landmarks)
+
+    def close(self):
+        if self.hands_runner is not None:
+            self.hands_runner.close()  # Закрывает и self.hands
+        else:
+            self.hands.close()  # Закрываем MediaPipe
+
+
+def to_display_image(image_rgb, out):
+    """RGB-кадр -> PIL-картинка размера буфера out: ресайз OpenCV в переиспользуемый out;
+    единственная копия на кадр - сама картинка, которую забирает главный поток"""
+    cv2.resize(image_rgb, (out.shape[1], out.shape[0]), dst=out, interpolation=cv2.INTER_LINEAR)
+    return Image.fromarray(out)
+
+
+class GuiStatePublisher:
+    """Снимок состояния GUI: рабочий поток публикует, главный поток Tk забирает"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+        self._version = 0
+
+    def publish(self, **state):
+        with self._lock:
+            self._state.update(state)
+            self._version += 1
+
+    def take(self, since_version):
+        """Возвращает (версия, копия состояния) или (since_version, None), если нового нет"""
+        with self._lock:
+            if self._version == since_version:
+                return since_version, None
+            return self._version, dict(self._state)
 
 
 class RockPaperScissors:
-    def __init__(self, root):
+    def __init__(self, root, gesture_classifier=None, samples_path="gesture_samples.npz",
+                 smoothing_window=5, switch_margin=1.2, latency_budget_ms=None,
+                 metrics=None, metrics_overlay=False, source="0", record_stream=None,
+                 profiler=None, startup_report=None, opponent="random"):
         self.root = root
+        self.source = source  # строка источника кадров для open_source
         self.root.title("Камень-Ножницы-Бумага с AI")
         self.root.geometry("1100x750")
         self.root.configure(bg="#2c3e50")
 
-        # Инициализация MediaPipe Hands для распознавания
-        self.mp_hands = mp.solutions.hands
-        self.hands = self.mp_hands.Hands(
-            static_image_mode=False,
-            max_num_hands=1,  # Распознаем только одну руку
-            min_detection_confidence=0.7,
-            min_tracking_confidence=0.7,
-            model_complexity=1
-        )
-        self.mp_drawing = mp.solutions.drawing_utils
-        self.mp_drawing_styles = mp.solutions.drawing_styles
+        # Замеры стадий; выключенные метрики почти ничего не стоят
+        self.metrics = metrics or StageMetrics(enabled=False)
+        self.metrics_overlay = metrics_overlay
+
+        # Распознавание жестов (MediaPipe Hands) вынесено в класс без GUI; собирается в фоне
+        self.recognizer = None
+        self.recognizer_ready = threading.Event()
+        self.loading_state = "Загрузка MediaPipe..."
+        self.profiler = profiler or StartupProfiler()
+        self.startup_report = startup_report
 
         # Переменные игры
         self.player_score = 0
@@ -35,19 +612,47 @@ class RockPaperScissors:
         self.max_rounds = 5
         self.is_capturing = False
         self.cap = None
+        self.video_thread = None
         self.player_choice = None
         self.computer_choice = None
         self.result_text = "Давайте начнем!"
+        # Ходы компьютера выбирает стратегия движка турниров (tournament.py); историю игрока
+        # она помнит и между играми
+        self.opponent = LiveOpponent(opponent)
 
         # Для распознавания
         self.last_gesture = "Не обнаружено"
         self.confidence = 0
         self.hand_detected = False
         self.finger_count = 0
-        self.gesture_history = []  # История жестов для стабилизации
+        self.gesture_smoother = GestureSmoother(smoothing_window, switch_margin=switch_margin)
+
+        # Режим записи образцов для обучения классификатора
+        self.is_recording = False
+        self.samples_path = samples_path
+        self.recording_label = 0  # индекс в GESTURES
+        self.recorded_samples = []
+        self.record_stream = record_stream  # файл записи сырых точек с метками (landmark_stream)
+        self.stream_writer = None
+
+        # Обновление GUI: поток видео публикует состояние, главный поток применяет разницу
+        self.gui_refresh_ms = 33  # ~30 обновлений в секунду
+        self.gui_state = GuiStatePublisher()
+        self.gui_version = 0
+        self.applied_state = {}
+        self.gui_after_id = None
+        self.display_size = (500, 380)
+        self.photo = None  # единственный PhotoImage видео; кадры вставляются через paste()
 
         # Создаем GUI
         self.create_widgets()
+        self.apply_gui_state()
+
+        # Окно уже на экране, пока MediaPipe импортируется и прогревается в фоне
+        self.root.after_idle(self.profiler.mark, "window_shown")
+        threading.Thread(target=self.load_recognizer, args=(gesture_classifier, latency_budget_ms),
+                         daemon=True).start()
+        self.root.after(100, self.poll_loading)
 
     def create_widgets(self):
         # Заголовок с современным дизайном
@@ -83,7 +688,8 @@ class RockPaperScissors:
         control_frame = tk.Frame(left_column, bg="#34495e")
         control_frame.pack(fill=tk.X, padx=20, pady=10)
 
-        self.start_btn = tk.Button(control_frame, text="▶ НАЧАТЬ ИГРУ",
+        # До готовности распознавателя кнопка показывает загрузку
+        self.start_btn = tk.Button(control_frame, text="⏳ ЗАГРУЗКА...", state=tk.DISABLED,
                                    command=self.start_camera, font=("Arial", 12, "bold"),
                                    bg="#27ae60", fg="white", width=15, height=2,
                                    activebackground="#229954", activeforeground="white")
@@ -95,6 +701,18 @@ class RockPaperScissors:
                                      state=tk.DISABLED, activebackground="#2980b9", activeforeground="white")
         self.capture_btn.pack(side=tk.LEFT, padx=5)
 
+        # Запись образцов жестов для обучения
+        record_frame = tk.Frame(left_column, bg="#34495e")
+        record_frame.pack(fill=tk.X, padx=20, pady=(0, 10))
+
+        self.record_label_var = tk.StringVar(value=GESTURES[0])
+        tk.OptionMenu(record_frame, self.record_label_var, *GESTURES[:3]).pack(side=tk.LEFT, padx=5)
+
+        self.record_btn = tk.Button(record_frame, text="⏺ ЗАПИСЬ", command=self.toggle_recording,
+                                    font=("Arial", 10, "bold"), bg="#c0392b", fg="white", width=15,
+                                    activebackground="#a93226", activeforeground="white")
+        self.record_btn.pack(side=tk.LEFT, padx=5)
+
         # Правая колонка - игра
         right_column = tk.Frame(main_container, bg="#34495e", relief=tk.RAISED, bd=2)
         right_column.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
@@ -161,7 +779,7 @@ class RockPaperScissors:
                                          font=("Arial", 20), bg="#2c3e50", fg="#e74c3c")
         self.status_indicator.pack(side=tk.LEFT, padx=(0, 10))
 
-        self.status_text = tk.Label(status_frame, text="Камера выключена",
+        self.status_text = tk.Label(status_frame, text=self.loading_state,
                                     font=("Arial", 12), bg="#2c3e50", fg="#95a5a6")
         self.status_text.pack(side=tk.LEFT)
 
@@ -218,47 +836,99 @@ class RockPaperScissors:
         tk.Label(instructions_frame, text="✊ Камень = сжатый кулак\n✌️ Ножницы = 2 пальца\n✋ Бумага = открытая ладонь",
                  font=("Arial", 10), bg="#34495e", fg="#bdc3c7", justify=tk.LEFT).pack()
 
+    def load_recognizer(self, gesture_classifier, latency_budget_ms):
+        """Фоновый поток: импорт MediaPipe, сборка и прогрев Hands"""
+        try:
+            load_vision_modules(self.profiler)
+            self.loading_state = "Сборка модели рук..."
+            with self.profiler.measure("hands_build"):
+                recognizer = GestureRecognizer(gesture_classifier, latency_budget_ms, self.metrics)
+            self.loading_state = "Прогрев модели..."
+            recognizer.warm_up(self.profiler)
+            self.recognizer = recognizer
+        except Exception as e:
+            print(f"Ошибка загрузки MediaPipe: {e}")
+            self.loading_state = f"Ошибка загрузки MediaPipe: {e}"
+        finally:
+            self.recognizer_ready.set()
+
+    def poll_loading(self):
+        """Показывает ход загрузки; Tk трогаем только из главного потока"""
+        if not self.recognizer_ready.is_set():
+            elapsed = time.perf_counter() - self.profiler.started
+            self.status_text.config(text=f"{self.loading_state} {elapsed:.1f} с")
+            self.root.after(100, self.poll_loading)
+            return
+
+        if self.recognizer is None:
+            self.start_btn.config(text="✖ ОШИБКА")
+            self.status_text.config(text=self.loading_state)
+            return
+
+        self.profiler.mark("interactive")
+        self.start_btn.config(text="▶ НАЧАТЬ ИГРУ", state=tk.NORMAL)
+        self.status_text.config(text="Камера выключена")
+        print(f"Профиль запуска: {self.profiler.report()}")
+        if self.startup_report:
+            self.profiler.save(self.startup_report)
+
     def start_camera(self):
-        self.cap = cv2.VideoCapture(0)
+        if self.recognizer is None:
+            return
+
+        # Новая игра после end_game: прежние поток видео и читатель еще держат камеру
+        self.stop_video()
+
+        # Фоновый читатель: show_video всегда получает самый свежий кадр
+        self.cap = open_source(self.source, 640, 480, threaded=True)
         if not self.cap.isOpened():
+            self.cap.release()
+            self.cap = None
             messagebox.showerror("Ошибка", "Не удалось подключить камеру!")
             return
 
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
         self.is_capturing = True
         self.start_btn.config(state=tk.DISABLED)
         self.capture_btn.config(state=tk.NORMAL)
         self.new_game_btn.config(state=tk.NORMAL)
 
         # Обновляем статус
-        self.status_indicator.config(fg="#2ecc71")
-        self.status_text.config(text="Камера активна - покажите жест")
+        self.gui_state.publish(indicator="#2ecc71", status="Камера активна - покажите жест")
 
         # Запускаем поток для отображения видео
-        threading.Thread(target=self.show_video, daemon=True).start()
+        self.video_thread = threading.Thread(target=self.show_video, daemon=True)
+        self.video_thread.start()
+
+    def stop_video(self):
+        """Останавливает поток видео и освобождает источник кадров"""
+        self.is_capturing = False
+        if self.video_thread is not None:
+            self.video_thread.join(timeout=2.0)  # read() читателя ждет кадр не дольше секунды
+            self.video_thread = None
+        if self.cap:
+            self.cap.release()
+            self.cap = None
 
     def show_video(self):
+        # Буфер кадра для показа: ресайз OpenCV пишет в него без новых массивов
+        display = np.empty((self.display_size[1], self.display_size[0], 3), dtype=np.uint8)
         while self.is_capturing and self.cap:
-            ret, frame = self.cap.read()
+            with self.metrics.stage("capture_read"):
+                ret, frame = self.cap.read()
             if ret:
-                # Зеркально отражаем кадр для удобства
-                frame = cv2.flip(frame, 1)
-
-                # Анализируем кадр с помощью MediaPipe
+                # Анализируем кадр с помощью MediaPipe; отражение и перевод в RGB - в одном буфере
                 processed_frame, gesture, confidence, finger_count = self.analyze_frame_with_mediapipe(frame)
 
-                # Сохраняем историю жестов (скользящее окно из 5 последних жестов)
-                if gesture != "Не обнаружено":
-                    self.gesture_history.append(gesture)
-                    if len(self.gesture_history) > 5:
-                        self.gesture_history.pop(0)
+                # Записываем нормализованные точки с выбранной меткой
+                if self.is_recording and gesture != "Не обнаружено":
+                    self.recorded_samples.append(normalize_landmarks(self.recognizer.landmark_buffer))
+                    writer = self.stream_writer
+                    if writer is not None:
+                        writer.append(self.recognizer.landmark_buffer, self.recording_label)
 
-                    # Определяем наиболее частый жест в истории для стабильности
-                    if len(self.gesture_history) >= 3:
-                        from collections import Counter
-                        most_common = Counter(self.gesture_history).most_common(1)[0][0]
-                        gesture = most_common
+                # Сглаживаем жест по окну последних кадров для стабильности
+                if gesture != "Не обнаружено":
+                    gesture = self.gesture_smoother.update(gesture, confidence)
 
                 # Обновляем информацию
                 self.last_gesture = gesture
@@ -266,167 +936,87 @@ class RockPaperScissors:
                 self.finger_count = finger_count
                 self.hand_detected = gesture != "Не обнаружено"
 
-                # Обновляем отображение
-                if self.hand_detected:
-                    self.recognition_label.config(text=gesture)
-                    self.status_indicator.config(fg="#2ecc71")
-                    self.status_text.config(text=f"Рука обнаружена ({confidence}%)")
-                else:
-                    self.recognition_label.config(text="—")
-                    self.status_indicator.config(fg="#e74c3c")
-                    self.status_text.config(text="Покажите руку в кадре")
-
-                # Конвертируем для отображения в Tkinter
-                rgb_img = cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(rgb_img)
-                img = img.resize((500, 380))
-                imgtk = ImageTk.PhotoImage(image=img)
+                if self.metrics_overlay:
+                    self.metrics.draw_overlay(processed_frame, origin=(10, 70), rgb=True)
 
-                self.video_label.imgtk = imgtk
-                self.video_label.config(image=imgtk)
+                # Кадр уже в RGB: остается уменьшить его для Tkinter
+                with self.metrics.stage("resize"):
+                    img = to_display_image(processed_frame, display)
+                self.metrics.tick()
 
-            time.sleep(0.03)  # ~30 FPS
+                # Публикуем снимок состояния; виджеты обновит главный поток
+                if self.hand_detected:
+                    self.gui_state.publish(recognition=gesture, indicator="#2ecc71",
+                                           status=f"Рука обнаружена ({confidence}%)", frame=img)
+                else:
+                    self.gui_state.publish(recognition="—", indicator="#e74c3c",
+                                           status="Покажите руку в кадре", frame=img)
+            else:
+                # Источник не отдал кадр - не крутим цикл вхолостую
+                time.sleep(0.01)
+
+    def apply_gui_state(self):
+        """Применяет к виджетам только изменившиеся поля опубликованного состояния"""
+        self.gui_version, state = self.gui_state.take(self.gui_version)
+        if state:
+            changed = {}
+            for key, value in state.items():
+                previous = self.applied_state.get(key)
+                # Кадры сравниваем по ссылке: новый кадр - всегда новый объект
+                if (value is not previous) if key == "frame" else (value != previous):
+                    changed[key] = value
+
+            if "recognition" in changed:
+                self.recognition_label.config(text=changed["recognition"])
+            if "indicator" in changed:
+                self.status_indicator.config(fg=changed["indicator"])
+            if "status" in changed:
+                self.status_text.config(text=changed["status"])
+            if "frame" in changed:
+                # PhotoImage создается один раз в главном потоке, дальше кадры копируются в него
+                with self.metrics.stage("photo_image"):
+                    if self.photo is None:
+                        self.photo = ImageTk.PhotoImage(image=changed["frame"])
+                        self.video_label.config(image=self.photo)
+                    else:
+                        self.photo.paste(changed["frame"])
+
+            self.applied_state.update(changed)
+
+        self.gui_after_id = self.root.after(self.gui_refresh_ms, self.apply_gui_state)
 
     def analyze_frame_with_mediapipe(self, frame):
-        """Анализ кадра с использованием MediaPipe Hands"""
-        # Конвертируем BGR в RGB
-        image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        image_rgb.flags.writeable = False
-
-        # Обрабатываем кадр
-        results = self.hands.process(image_rgb)
-
-        # Включаем запись обратно
-        image_rgb.flags.writeable = True
-        processed_frame = frame.copy()
-
-        gesture = "Не обнаружено"
-        confidence = 0
-        finger_count = 0
-
-        if results.multi_hand_landmarks:
-            for hand_landmarks in results.multi_hand_landmarks:
-                # Рисуем landmarks на кадре
-                self.mp_drawing.draw_landmarks(
-                    processed_frame,
-                    hand_landmarks,
-                    self.mp_hands.HAND_CONNECTIONS,
-                    self.mp_drawing_styles.get_default_hand_landmarks_style(),
-                    self.mp_drawing_styles.get_default_hand_connections_style()
-                )
-
-                # Получаем координаты ключевых точек
-                landmarks = hand_landmarks.landmark
-
-                # Определяем жест
-                gesture, confidence, finger_count = self.recognize_gesture(landmarks, processed_frame.shape)
-
-                # Отображаем жест на кадре
-                if gesture != "Не обнаружено":
-                    cv2.putText(processed_frame, f"{gesture} ({confidence}%)",
-                                (10, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-
-                # Добавляем подсказки
-                cv2.putText(processed_frame, "Покажите: Камень ✊, Ножницы ✌️ или Бумага ✋",
-                            (10, processed_frame.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-
-                break  # Обрабатываем только первую руку
-
-        return processed_frame, gesture, confidence, finger_count
+        """Анализ кадра с использованием MediaPipe Hands: отраженный RGB-кадр с разметкой"""
+        return self.recognizer.analyze_frame_rgb(frame, mirror=True)
 
     def recognize_gesture(self, landmarks, frame_shape):
         """Определение жеста по ключевым точкам"""
-        # Индексы ключевых точек для пальцев
-        thumb_tip = landmarks[self.mp_hands.HandLandmark.THUMB_TIP]
-        thumb_ip = landmarks[self.mp_hands.HandLandmark.THUMB_IP]
-        thumb_mcp = landmarks[self.mp_hands.HandLandmark.THUMB_MCP]
-
-        index_tip = landmarks[self.mp_hands.HandLandmark.INDEX_FINGER_TIP]
-        index_pip = landmarks[self.mp_hands.HandLandmark.INDEX_FINGER_PIP]
-        index_mcp = landmarks[self.mp_hands.HandLandmark.INDEX_FINGER_MCP]
-
-        middle_tip = landmarks[self.mp_hands.HandLandmark.MIDDLE_FINGER_TIP]
-        middle_pip = landmarks[self.mp_hands.HandLandmark.MIDDLE_FINGER_PIP]
-        middle_mcp = landmarks[self.mp_hands.HandLandmark.MIDDLE_FINGER_MCP]
-
-        ring_tip = landmarks[self.mp_hands.HandLandmark.RING_FINGER_TIP]
-        ring_pip = landmarks[self.mp_hands.HandLandmark.RING_FINGER_PIP]
-        ring_mcp = landmarks[self.mp_hands.HandLandmark.RING_FINGER_MCP]
-
-        pinky_tip = landmarks[self.mp_hands.HandLandmark.PINKY_TIP]
-        pinky_pip = landmarks[self.mp_hands.HandLandmark.PINKY_PIP]
-        pinky_mcp = landmarks[self.mp_hands.HandLandmark.PINKY_MCP]
-
-        wrist = landmarks[self.mp_hands.HandLandmark.WRIST]
-
-        # Подсчитываем поднятые пальцы
-        fingers_up = 0
-
-        # Проверяем большой палец (специальная логика)
-        thumb_angle = self.calculate_angle(thumb_tip, thumb_ip, thumb_mcp)
-        if thumb_tip.y < thumb_ip.y and abs(thumb_tip.x - thumb_ip.x) > 0.05:
-            fingers_up += 1
-
-        # Проверяем указательный палец
-        if index_tip.y < index_pip.y:
-            fingers_up += 1
-
-        # Проверяем средний палец
-        if middle_tip.y < middle_pip.y:
-            fingers_up += 1
-
-        # Проверяем безымянный палец
-        if ring_tip.y < ring_pip.y:
-            fingers_up += 1
-
-        # Проверяем мизинец
-        if pinky_tip.y < pinky_pip.y:
-            fingers_up += 1
-
-        # Определяем жест по количеству поднятых пальцев
-        if fingers_up == 0:
-            gesture = "Камень"
-            confidence = 95
-        elif fingers_up == 2:
-            # Проверяем, какие именно пальцы подняты
-            index_up = index_tip.y < index_pip.y
-            middle_up = middle_tip.y < middle_pip.y
-            ring_up = ring_tip.y < ring_pip.y
-            pinky_up = pinky_tip.y < pinky_pip.y
-
-            if index_up and middle_up and not ring_up and not pinky_up:
-                gesture = "Ножницы"
-                confidence = 90
-            else:
-                gesture = "Неизвестно"
-                confidence = 50
-        elif fingers_up >= 4:
-            gesture = "Бумага"
-            confidence = 85
-        else:
-            gesture = "Неизвестно"
-            confidence = 60
-
-        return gesture, confidence, fingers_up
-
-    def calculate_angle(self, a, b, c):
-        """Вычисляет угол между тремя точками"""
-        import math
-
-        # Преобразуем в numpy массивы для удобства
-        a_np = np.array([a.x, a.y])
-        b_np = np.array([b.x, b.y])
-        c_np = np.array([c.x, c.y])
-
-        # Вычисляем векторы
-        ba = a_np - b_np
-        bc = c_np - b_np
+        return self.recognizer.recognize_gesture(landmarks, frame_shape)
+
+    def toggle_recording(self):
+        """Включает/выключает запись образцов; при выключении дописывает их в файл"""
+        if not self.is_recording:
+            self.recorded_samples = []
+            self.recording_label = GESTURES.index(self.record_label_var.get())
+            if self.record_stream:
+                self.stream_writer = LandmarkStreamWriter(self.record_stream)
+            self.is_recording = True
+            self.record_btn.config(text="⏹ СТОП ЗАПИСИ")
+            return
 
-        # Вычисляем косинус угла
-        cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc))
-        angle = np.arccos(cosine_angle)
+        self.is_recording = False
+        self.record_btn.config(text="⏺ ЗАПИСЬ")
+        writer, self.stream_writer = self.stream_writer, None
+        if writer is not None:
+            writer.close()
+        samples, self.recorded_samples = self.recorded_samples, []
+        if not samples:
+            messagebox.showwarning("Запись", "Не записано ни одного кадра с рукой")
+            return
 
-        return np.degrees(angle)
+        total = save_samples(self.samples_path, samples, [self.recording_label] * len(samples))
+        messagebox.showinfo("Запись", f"Записано {len(samples)} кадров "
+                                      f"«{GESTURES[self.recording_label]}», всего образцов: {total}")
 
     def capture_hand(self):
         if not self.cap or not self.is_capturing:
@@ -457,7 +1047,7 @@ class RockPaperScissors:
                 return
 
         # Ход компьютера
-        self.computer_choice = random.choice(["камень", "ножницы", "бумага"])
+        self.computer_choice = self.opponent.choose()
 
         # Обновляем отображение выборов
         emoji_dict = {
@@ -505,7 +1095,7 @@ class RockPaperScissors:
             manual_window.destroy()
 
             # Ход компьютера
-            self.computer_choice = random.choice(["камень", "ножницы", "бумага"])
+            self.computer_choice = self.opponent.choose()
 
             # Обновляем отображение
             emoji_dict = {
@@ -555,11 +1145,11 @@ class RockPaperScissors:
                   font=("Arial", 12), bg="#7f8c8d", fg="white", width=15).pack(pady=10)
 
     def determine_winner(self):
-        if self.player_choice == self.computer_choice:
+        outcome = judge_round(self.player_choice, self.computer_choice)
+        self.opponent.observe(self.player_choice)
+        if outcome == 0:
             self.result_text = "НИЧЬЯ! 🤝"
-        elif (self.player_choice == "камень" and self.computer_choice == "ножницы") or \
-                (self.player_choice == "ножницы" and self.computer_choice == "бумага") or \
-                (self.player_choice == "бумага" and self.computer_choice == "камень"):
+        elif outcome > 0:
             self.result_text = "ВЫ ВЫИГРАЛИ! 🎉"
             self.player_score += 1
         else:
@@ -586,7 +1176,7 @@ class RockPaperScissors:
         self.player_choice = None
         self.computer_choice = None
         self.result_text = "Давайте начнем!"
-        self.gesture_history = []
+        self.gesture_smoother.reset()
 
         self.player_score_label.config(text="0")
         self.computer_score_label.config(text="0")
@@ -594,9 +1184,7 @@ class RockPaperScissors:
         self.computer_choice_display.config(text="—")
         self.result_label.config(text=self.result_text)
         self.round_label.config(text=f"Раунд: {self.round_count}/{self.max_rounds}")
-        self.recognition_label.config(text="—")
-        self.status_indicator.config(fg="#e74c3c")
-        self.status_text.config(text="Камера выключена")
+        self.gui_state.publish(recognition="—", indicator="#e74c3c", status="Камера выключена")
 
         if not self.is_capturing:
             self.start_camera()
@@ -604,15 +1192,57 @@ class RockPaperScissors:
             self.capture_btn.config(state=tk.NORMAL)
 
     def on_closing(self):
-        self.is_capturing = False
-        if self.cap:
-            self.cap.release()
-        self.hands.close()  # Закрываем MediaPipe
+        if self.gui_after_id:
+            self.root.after_cancel(self.gui_after_id)
+        # Сначала дожидаемся потока видео: он может быть внутри hands.process или записи точек
+        self.stop_video()
+        if self.stream_writer is not None:
+            self.stream_writer.close()
+        if self.recognizer is not None:
+            self.recognizer.close()
         self.root.destroy()
 
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Камень-ножницы-бумага с распознаванием жестов")
+    parser.add_argument("--gesture-model", metavar="PATH",
+                        help="обученный классификатор жестов (.npz) вместо правил по пальцам")
+    parser.add_argument("--samples", default="gesture_samples.npz",
+                        help="файл записанных образцов жестов")
+    parser.add_argument("--record-stream", metavar="PATH",
+                        help="при записи образцов дописывать сырые точки руки с метками и временем "
+                             "в этот файл (оценка: python landmark_stream.py PATH)")
+    parser.add_argument("--train", action="store_true",
+                        help="обучить классификатор по --samples и сохранить в --gesture-model")
+    parser.add_argument("--smoothing-window", type=int, default=5,
+                        help="число кадров в окне сглаживания жеста")
+    parser.add_argument("--switch-margin", type=float, default=1.2,
+                        help="во сколько раз новый жест должен набрать больше веса, чтобы сменить текущий")
+    parser.add_argument("--latency-budget-ms", type=float,
+                        help="адаптивный режим: ROI вокруг руки и выбор сложности модели "
+                             "под заданное время обработки кадра")
+    parser.add_argument("--opponent", default="random",
+                        help=f"стратегия компьютера: {', '.join(STRATEGIES)} или с параметрами, "
+                             "например markov:0.9 (сравнение: python tournament.py)")
+    parser.add_argument("--startup-report", metavar="PATH",
+                        help="дописывать профиль запуска (время до готовности игры) в JSONL-файл")
+    add_metrics_arguments(parser)
+    add_source_argument(parser)
+    args = parser.parse_args(argv)
+    try:
+        make_strategy(args.opponent)
+    except ValueError as e:
+        parser.error(f"--opponent: {e}")
+    return args
+
+
 # Запуск программы
 if __name__ == "__main__":
+    args = parse_args()
+    if args.train:
+        train_classifier(args.samples, args.gesture_model or "gesture_model.npz")
+        raise SystemExit(0)
+
     print("=" * 60)
     print("КАМЕНЬ-НОЖНИЦЫ-БУМАГА с AI-распознаванием жестов")
     print("Использует MediaPipe для точного распознавания рук")
@@ -626,7 +1256,16 @@ if __name__ == "__main__":
     print("3. Используйте хорошее освещение")
     print("=" * 60)
 
+    classifier = GestureClassifier.load(args.gesture_model) if args.gesture_model else None
+
+    profiler = StartupProfiler(_import_started, IMPORT_SECONDS)
+    metrics, exporter = metrics_from_args(args, "knb")
     root = tk.Tk()
-    game = RockPaperScissors(root)
+    game = RockPaperScissors(root, classifier, args.samples, args.smoothing_window, args.switch_margin,
+                             args.latency_budget_ms, metrics, args.metrics_overlay, source=args.source,
+                             record_stream=args.record_stream, profiler=profiler,
+                             startup_report=args.startup_report, opponent=args.opponent)
     root.protocol("WM_DELETE_WINDOW", game.on_closing)
     root.mainloop()
+    if exporter:
+        exporter.stop()
@@ -0,0 +1,398 @@
+import argparse
+import json
+import math
+import os
+import threading
+import time
+import tkinter as tk
+
+import cv2
+from PIL import Image, ImageTk
+
+from frame_sources import open_source
+from knb import GESTURES, GestureClassifier, GestureRecognizer, GestureSmoother, GuiStatePublisher
+from metrics import StageMetrics, add_metrics_arguments, metrics_from_args
+from tournament import MOVES, LiveOpponent, judge_round
+
+# Распознанный жест -> ход игры
+GESTURE_MOVES = dict(zip(GESTURES[:3], MOVES))
+
+
+class Table:
+    """Один игровой стол: источник кадров, свой GestureRecognizer (трекинг Hands не смешивается
+    с другими столами), сглаживание жеста и счет"""
+
+    def __init__(self, name, source, recognizer, smoothing_window=5, switch_margin=1.2,
+                 max_rounds=5, auto_play_frames=0, tile_size=(320, 240), opponent="random"):
+        self.name = name
+        self.source = source
+        self.recognizer = recognizer
+        self.smoother = GestureSmoother(smoothing_window, switch_margin=switch_margin)
+        self.max_rounds = max_rounds
+        self.auto_play_frames = auto_play_frames  # ход после стольких кадров одного жеста; 0 - выкл.
+        self.tile_size = tile_size
+        self.opponent = LiveOpponent(opponent)  # стратегия компьютера из tournament.py
+
+        # Состояние игры меняют рабочий поток (автоход) и кнопка в главном потоке
+        self._lock = threading.Lock()
+        self.player_score = 0
+        self.computer_score = 0
+        self.round_count = 1
+        self.games_played = 0
+        self.result_text = "Давайте начнем!"
+        self.last_gesture = "Не обнаружено"
+        self.confidence = 0
+        self.finger_count = 0
+        self._held_frames = 0
+        self._wait_release = False  # после автохода ждем, пока жест сменится
+
+        self.fps_meter = StageMetrics(window=64)
+        self.frames = 0
+        self.gui_state = GuiStatePublisher()
+        self.busy = False  # кадр стола в обработке (меняет только планировщик)
+        self.finished = False
+        self.errors = 0
+        self.error_streak = 0  # ошибок подряд; сбрасывается успешным кадром
+
+    def ready(self):
+        """Можно ли отдать стол рабочему потоку прямо сейчас"""
+        if self.busy or self.finished:
+            return False
+        # Без фонового чтения (режим замеров) кадр есть всегда
+        if not hasattr(self.source, "has_frame"):
+            return True
+        # Закончившийся источник тоже отдаем: step() пометит стол завершенным
+        return self.source.has_frame() or self.source.exhausted()
+
+    def step(self, render=True):
+        """Читает и обрабатывает один кадр; вызывается рабочим потоком пула"""
+        ret, frame = self.source.read()
+        if not ret:
+            if not hasattr(self.source, "exhausted") or self.source.exhausted():
+                self.finished = True  # источник закончился
+            return
+
+        frame = cv2.flip(frame, 1)
+        if render:
+            processed, gesture, confidence, finger_count = self.recognizer.analyze_frame_with_mediapipe(frame)
+        else:
+            processed = None
+            gesture, confidence, finger_count = self.recognizer.recognize_frame(frame)
+        if gesture != "Не обнаружено":
+            gesture = self.smoother.update(gesture, confidence)
+
+        with self._lock:
+            self.last_gesture = gesture
+            self.confidence = confidence
+            self.finger_count = finger_count
+            self._auto_play(gesture)
+        self.frames += 1
+        self.fps_meter.tick()
+
+        state = self.snapshot()
+        if processed is not None:
+            # Кадр уменьшаем здесь, в рабочем потоке; PhotoImage создаст главный поток
+            tile = cv2.resize(processed, self.tile_size, interpolation=cv2.INTER_AREA)
+            state["frame"] = Image.fromarray(cv2.cvtColor(tile, cv2.COLOR_BGR2RGB))
+        self.gui_state.publish(**state)
+
+    def _auto_play(self, gesture):
+        if not self.auto_play_frames:
+            return
+        if gesture not in GESTURE_MOVES:
+            self._held_frames = 0
+            self._wait_release = False
+            return
+        self._held_frames += 1
+        if not self._wait_release and self._held_frames >= self.auto_play_frames:
+            self._wait_release = True
+            self._play_locked(GESTURE_MOVES[gesture])
+
+    def play(self, player_choice=None):
+        """Ход по текущему жесту (или заданному); False, если жест не распознан"""
+        with self._lock:
+            player_choice = player_choice or GESTURE_MOVES.get(self.last_gesture)
+            if player_choice is None:
+                return False
+            self._play_locked(player_choice)
+        self.gui_state.publish(**self.snapshot())
+        return True
+
+    def _play_locked(self, player_choice):
+        computer_choice = self.opponent.choose()
+        outcome = judge_round(player_choice, computer_choice)
+        self.opponent.observe(player_choice)
+        if outcome > 0:
+            self.player_score += 1
+        elif outcome < 0:
+            self.computer_score += 1
+        self.result_text = f"{player_choice} vs {computer_choice}: " + \
+            ("ничья" if outcome == 0 else "игрок" if outcome > 0 else "компьютер")
+
+        self.round_count += 1
+        if self.round_count > self.max_rounds:
+            # Конец игры: итог остается на экране, следующий ход начинает новую игру
+            self.result_text = f"Игра окончена {self.player_score}:{self.computer_score}"
+            self.games_played += 1
+            self.player_score = self.computer_score = 0
+            self.round_count = 1
+
+    def snapshot(self):
+        with self._lock:
+            return {"gesture": self.last_gesture, "confidence": self.confidence,
+                    "score": f"{self.player_score}:{self.computer_score}",
+                    "round": f"{self.round_count}/{self.max_rounds}",
+                    "result": self.result_text, "fps": round(self.fps_meter.fps(), 1)}
+
+    def close(self):
+        self.source.release()
+        self.recognizer.close()
+
+
+class TableScheduler:
+    """Общий пул потоков инференса для всех столов. Столы обслуживаются по кругу, у каждого
+    не больше одного кадра в обработке - быстрый источник не вытесняет медленные"""
+
+    max_error_streak = 30  # столько ошибок подряд - стол останавливается
+
+    def __init__(self, tables, workers=None, render=True, metrics=None):
+        self.tables = tables
+        self.workers = workers or os.cpu_count() or 1
+        self.render = render
+        self.metrics = metrics or StageMetrics(enabled=False)
+        self._cond = threading.Condition()
+        self._cursor = 0
+        self._running = False
+        self._threads = []
+        for table in tables:
+            if hasattr(table.source, "on_frame"):
+                table.source.on_frame = self._wake
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify()
+
+    def start(self):
+        self._running = True
+        self._threads = [threading.Thread(target=self._worker, name=f"table-worker-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _next_table(self):
+        """Первый готовый стол после обслуженного последним (вызывается под self._cond)"""
+        count = len(self.tables)
+        for offset in range(count):
+            index = (self._cursor + offset) % count
+            table = self.tables[index]
+            if table.ready():
+                table.busy = True
+                self._cursor = index + 1
+                return table
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                table = None
+                while self._running and table is None:
+                    table = self._next_table()
+                    if table is None:
+                        self._cond.wait(0.1)
+                if not self._running:
+                    return
+
+            try:
+                with self.metrics.stage("table_step"):
+                    table.step(self.render)
+                table.error_streak = 0
+            except Exception as e:
+                # Ошибка кадра (MediaPipe, битый кадр) не должна завершать рабочий поток пула
+                self._step_failed(table, e)
+            finally:
+                with self._cond:
+                    table.busy = False
+                    self._cond.notify()
+
+    def _step_failed(self, table, error):
+        table.errors += 1
+        table.error_streak += 1
+        if table.errors == 1 or table.errors % 100 == 0:  # редкий лог: ошибка может быть на каждом кадре
+            print(f"{table.name}: ошибка обработки кадра (всего {table.errors}): {error}")
+        if table.error_streak >= self.max_error_streak:
+            print(f"{table.name}: остановлен после {table.error_streak} ошибок подряд")
+            table.finished = True
+            with table._lock:
+                table.result_text = f"Остановлен: {error}"
+            table.gui_state.publish(**table.snapshot())
+
+    def finished(self):
+        return all(table.finished for table in self.tables)
+
+    def total_fps(self):
+        return sum(table.fps_meter.fps() for table in self.tables)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+
+
+class TablesDashboard:
+    """Одно окно Tk с плитками всех столов"""
+
+    def __init__(self, root, scheduler, refresh_ms=33):
+        self.root = root
+        self.scheduler = scheduler
+        self.refresh_ms = refresh_ms
+        self.root.title("Камень-Ножницы-Бумага: столы")
+        self.root.configure(bg="#2c3e50")
+        self.versions = [0] * len(scheduler.tables)
+        self.tiles = []
+        self.after_id = None
+
+        columns = math.ceil(math.sqrt(len(scheduler.tables)))
+        for index, table in enumerate(scheduler.tables):
+            self.tiles.append(self._create_tile(table, index // columns, index % columns))
+
+        self.total_label = tk.Label(self.root, text="", font=("Arial", 12, "bold"), bg="#2c3e50", fg="#f1c40f")
+        self.total_label.grid(row=len(scheduler.tables) // columns + 1, column=0, columnspan=columns, pady=5)
+        self.refresh()
+
+    def _create_tile(self, table, row, column):
+        frame = tk.Frame(self.root, bg="#34495e", relief=tk.RAISED, bd=2)
+        frame.grid(row=row, column=column, padx=5, pady=5)
+
+        title = tk.Label(frame, text=table.name, font=("Arial", 12, "bold"), bg="#1a5276", fg="white")
+        title.pack(fill=tk.X)
+        # Пустая картинка размера плитки: без картинки width/height метки считаются в символах,
+        # и плитка медленного или мертвого источника раздулась бы на весь экран
+        blank = tk.PhotoImage(width=table.tile_size[0], height=table.tile_size[1])
+        video = tk.Label(frame, bg="black", image=blank)
+        video.imgtk = blank
+        video.pack(padx=5, pady=5)
+        gesture = tk.Label(frame, text="—", font=("Arial", 14, "bold"), bg="#34495e", fg="#2ecc71")
+        gesture.pack()
+        score = tk.Label(frame, text="0:0", font=("Arial", 12), bg="#34495e", fg="white")
+        score.pack()
+        result = tk.Label(frame, text=table.result_text, font=("Arial", 10), bg="#34495e", fg="#f1c40f")
+        result.pack()
+        tk.Button(frame, text="✋ СДЕЛАТЬ ХОД", command=table.play, font=("Arial", 10, "bold"),
+                  bg="#3498db", fg="white").pack(pady=5)
+        return {"title": title, "video": video, "gesture": gesture, "score": score, "result": result}
+
+    def refresh(self):
+        for index, (table, tile) in enumerate(zip(self.scheduler.tables, self.tiles)):
+            self.versions[index], state = table.gui_state.take(self.versions[index])
+            if not state:
+                continue
+            tile["title"].config(text=f"{table.name} - {state['fps']:.1f} FPS")
+            tile["gesture"].config(text=f"{state['gesture']} ({state['confidence']}%)")
+            tile["score"].config(text=f"Счет {state['score']}, раунд {state['round']}")
+            tile["result"].config(text=state["result"])
+            if "frame" in state:
+                imgtk = ImageTk.PhotoImage(image=state["frame"])
+                tile["video"].imgtk = imgtk
+                tile["video"].config(image=imgtk)
+
+        self.total_label.config(text=f"Столов: {len(self.tiles)}, потоков: {self.scheduler.workers}, "
+                                     f"всего {self.scheduler.total_fps():.1f} FPS")
+        self.after_id = self.root.after(self.refresh_ms, self.refresh)
+
+    def on_closing(self):
+        if self.after_id:
+            self.root.after_cancel(self.after_id)
+        self.root.destroy()
+
+
+def run_headless(scheduler, duration=None, report_interval=5.0):
+    """Работа без окна: периодическая сводка по столам, в конце - итог в JSON"""
+    started = time.perf_counter()
+    scheduler.start()
+    try:
+        next_report = started + report_interval
+        while not scheduler.finished():
+            now = time.perf_counter()
+            if duration and now - started >= duration:
+                break
+            if now >= next_report:
+                line = ", ".join(f"{t.name}: {t.fps_meter.fps():.1f} FPS {t.snapshot()['score']}"
+                                 for t in scheduler.tables)
+                print(f"[{now - started:6.1f} с] всего {scheduler.total_fps():.1f} FPS | {line}", flush=True)
+                next_report += report_interval
+            time.sleep(0.05)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.stop()
+
+    elapsed = time.perf_counter() - started
+    tables = [{**t.snapshot(), "name": t.name, "frames": t.frames, "fps": round(t.frames / elapsed, 2),
+               "games_played": t.games_played, "errors": t.errors} for t in scheduler.tables]
+    return {"workers": scheduler.workers, "seconds": round(elapsed, 2),
+            "total_fps": round(sum(t.frames for t in scheduler.tables) / elapsed, 2), "tables": tables}
+
+
+def build_tables(sources, args, metrics):
+    tables = []
+    for index, spec in enumerate(sources):
+        classifier = GestureClassifier.load(args.gesture_model) if args.gesture_model else None
+        recognizer = GestureRecognizer(classifier, args.latency_budget_ms, metrics)
+        source = open_source(spec, 640, 480, threaded=not args.pull)
+        if not source.isOpened():
+            source.release()
+            recognizer.close()
+            raise SystemExit(f"Не удалось открыть источник: {spec}")
+        tables.append(Table(f"Стол {index + 1}", source, recognizer, args.smoothing_window,
+                            args.switch_margin, auto_play_frames=args.auto_play, opponent=args.opponent))
+    return tables
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Несколько столов «Камень-ножницы-бумага» в одном процессе")
+    parser.add_argument("--source", action="append",
+                        help="источник кадров стола (по одному флагу на стол); по умолчанию камера 0")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="потоков инференса на все столы")
+    parser.add_argument("--headless", action="store_true", help="без окна: сводка в консоль")
+    parser.add_argument("--duration", type=float, help="остановиться через столько секунд (без окна)")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="период сводки без окна, с")
+    parser.add_argument("--auto-play", type=int, default=0, metavar="FRAMES",
+                        help="делать ход, когда жест держится столько кадров (0 - только кнопкой)")
+    parser.add_argument("--pull", action="store_true",
+                        help="читать кадры в рабочих потоках без фонового чтения "
+                             "(для замера пропускной способности, например с synthetic:0)")
+    parser.add_argument("--opponent", default="random",
+                        help="стратегия компьютера на всех столах (см. python tournament.py)")
+    parser.add_argument("--gesture-model", metavar="PATH", help="обученный классификатор жестов (.npz)")
+    parser.add_argument("--smoothing-window", type=int, default=5)
+    parser.add_argument("--switch-margin", type=float, default=1.2)
+    parser.add_argument("--latency-budget-ms", type=float,
+                        help="адаптивный режим: ROI вокруг руки и сложность модели под бюджет кадра")
+    add_metrics_arguments(parser)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    metrics, exporter = metrics_from_args(args, "knb_tables")
+    tables = build_tables(args.source or ["0"], args, metrics)
+    scheduler = TableScheduler(tables, args.workers, render=not args.headless, metrics=metrics)
+    try:
+        if args.headless:
+            print(json.dumps(run_headless(scheduler, args.duration, args.report_interval),
+                             ensure_ascii=False, indent=2))
+        else:
+            root = tk.Tk()
+            dashboard = TablesDashboard(root, scheduler.start())
+            root.protocol("WM_DELETE_WINDOW", dashboard.on_closing)
+            root.mainloop()
+            scheduler.stop()
+    finally:
+        for table in tables:
+            table.close()
+        if exporter:
+            exporter.stop()
@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Формат записи: 16 байт заголовка и подряд записи фиксированного размера - файл читается
+# через np.memmap без разбора, а оборванная запись в конце просто отбрасывается
+MAGIC = b"KNBLMK01"
+HEADER_SIZE = 16
+RECORD_DTYPE = np.dtype([("timestamp", "<f8"), ("label", "<i4"), ("points", "<f4", (21, 3))])
+UNLABELED = -1
+
+
+def _header():
+    return MAGIC + np.array([RECORD_DTYPE.itemsize, 0], dtype="<u4").tobytes()
+
+
+class LandmarkStreamWriter:
+    """Дописывает кадры (время, метка, точки руки (21, 3)) в файл; пишет пачками по chunk записей"""
+
+    def __init__(self, path, chunk=256):
+        self.path = path
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new_file:
+            _check_header(path)
+            # Оборванную запись в конце отрезаем, иначе все дописанные за ней записи сдвинутся
+            size = os.path.getsize(path)
+            whole = HEADER_SIZE + (size - HEADER_SIZE) // RECORD_DTYPE.itemsize * RECORD_DTYPE.itemsize
+            if whole != size:
+                os.truncate(path, whole)
+        self._file = open(path, "ab")
+        if new_file:
+            self._file.write(_header())
+        self._chunk = np.zeros(chunk, dtype=RECORD_DTYPE)
+        self._size = 0
+        self._lock = threading.Lock()  # пишет поток видео, закрывает главный поток
+        self.written = 0
+
+    def append(self, points, label=UNLABELED, timestamp=None):
+        with self._lock:
+            if self._file.closed:
+                return
+            record = self._chunk[self._size]
+            record["timestamp"] = time.time() if timestamp is None else timestamp
+            record["label"] = label
+            record["points"] = points
+            self._size += 1
+            if self._size == len(self._chunk):
+                self._flush()
+
+    def _flush(self):
+        if self._size:
+            self._file.write(self._chunk[:self._size].tobytes())
+            self.written += self._size
+            self._size = 0
+        self._file.flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._flush()
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _check_header(path):
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE or header[:8] != MAGIC:
+        raise ValueError(f"{path}: не файл записи точек руки")
+    record_size = int(np.frombuffer(header[8:12], dtype="<u4")[0])
+    if record_size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"{path}: размер записи {record_size}, ожидался {RECORD_DTYPE.itemsize}")
+
+
+def load_landmark_stream(path):
+    """Записи файла как np.memmap со структурой RECORD_DTYPE (только чтение, без копирования)"""
+    _check_header(path)
+    count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+def evaluate(paths, classifier=None, chunk=262144):
+    """Классификация записанных кадров пачками без MediaPipe: матрица ошибок и точность.
+    Учитываются только размеченные кадры; classifier=None - правила по пальцам"""
+    import knb
+
+    classes = len(knb.GESTURES)
+    confusion = np.zeros((classes, classes), dtype=np.int64)
+    frames = 0
+    started = time.perf_counter()
+    for path in paths:
+        records = load_landmark_stream(path)
+        for start in range(0, len(records), chunk):
+            part = records[start:start + chunk]
+            labeled = part["label"] >= 0
+            if not labeled.all():
+                part = part[labeled]
+            if not len(part):
+                continue
+            points = np.ascontiguousarray(part["points"])
+            if classifier is None:
+                predicted = knb.classify_hands(points)[0]
+            else:
+                predicted = classifier.classify_batch(points)[0]
+            truth = part["label"].astype(np.int64)
+            confusion += np.bincount(truth * classes + predicted, minlength=classes * classes) \
+                .reshape(classes, classes)
+            frames += len(part)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "frames": frames,
+        "accuracy": float(np.trace(confusion) / frames) if frames else 0.0,
+        "confusion": confusion,
+        "labels": knb.GESTURES,
+        "seconds": elapsed,
+        "frames_per_minute": frames / elapsed * 60 if elapsed else 0.0,
+    }
+
+
+def print_report(report):
+    labels = report["labels"]
+    confusion = report["confusion"]
+    width = max(len(label) for label in labels) + 2
+    corner = "факт / прогноз"
+    print(f"{corner:{width + 4}}" + "".join(f"{label:>{width}}" for label in labels) + f"{'полнота':>10}")
+    for label, row in zip(labels, confusion):
+        total = row.sum()
+        if not total:
+            continue
+        recall = row[labels.index(label)] / total
+        print(f"{label:{width + 4}}" + "".join(f"{value:>{width}}" for value in row) + f"{recall:>10.1%}")
+    print(f"Кадров: {report['frames']}, точность: {report['accuracy']:.2%}, "
+          f"{report['frames_per_minute'] / 1e6:.1f} млн кадров/мин")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Оценка распознавания жестов по записанным точкам руки")
+    parser.add_argument("paths", nargs="+", help="файлы записи точек (--record-stream в knb.py)")
+    parser.add_argument("--gesture-model", metavar="PATH",
+                        help="оценивать обученный классификатор (.npz) вместо правил по пальцам")
+    parser.add_argument("--output", help="сохранить отчет в JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    classifier = None
+    if args.gesture_model:
+        import knb
+        classifier = knb.GestureClassifier.load(args.gesture_model)
+
+    report = evaluate(args.paths, classifier)
+    if not report["frames"]:
+        print("Нет размеченных кадров", file=sys.stderr)
+        sys.exit(1)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({**report, "confusion": report["confusion"].tolist()}, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,221 @@
+import json
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+# Один общий «пустой» таймер: при выключенных метриках stage() ничего не создает
+_NULL_TIMER = nullcontext()
+
+
+class _StageTimer:
+    """Легкий таймер стадии (дешевле генераторного contextmanager)"""
+
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter() - self.started)
+
+
+class StageMetrics:
+    """Время стадий обработки кадра: скользящие p50/p95/p99 и достигнутый FPS"""
+
+    def __init__(self, enabled=True, window=512):
+        self.enabled = enabled
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}  # стадия -> [кольцевой буфер в мс, позиция, всего замеров]
+        self._ticks = np.zeros(window, dtype=np.float64)
+        self._tick_count = 0
+
+    def stage(self, name):
+        """Контекстный менеджер замера стадии; при выключенных метриках - пустышка"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, name)
+
+    def record(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._samples.get(name)
+            if entry is None:
+                entry = self._samples[name] = [np.zeros(self.window, dtype=np.float64), 0, 0]
+            entry[0][entry[1]] = seconds * 1000
+            entry[1] = (entry[1] + 1) % self.window
+            entry[2] += 1
+
+    def tick(self):
+        """Отметка о готовом кадре - по ним считается FPS"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._ticks[self._tick_count % self.window] = time.perf_counter()
+            self._tick_count += 1
+
+    def fps(self):
+        with self._lock:
+            count = min(self._tick_count, self.window)
+            if count < 2:
+                return 0.0
+            last = self._ticks[(self._tick_count - 1) % self.window]
+            first = self._ticks[(self._tick_count - count) % self.window]
+        return (count - 1) / (last - first) if last > first else 0.0
+
+    def summary(self):
+        """{стадия: {count, p50, p95, p99}} по последним window замерам, в мс"""
+        with self._lock:
+            entries = {name: (buffer[:min(total, self.window)].copy(), total)
+                       for name, (buffer, _, total) in self._samples.items()}
+
+        summary = {}
+        for name, (values, total) in entries.items():
+            if not len(values):
+                continue
+            p50, p95, p99 = np.percentile(values, (50, 95, 99))
+            summary[name] = {"count": total, "p50": p50, "p95": p95, "p99": p99}
+        return summary
+
+    def draw_overlay(self, image, origin=(10, 20), scale=0.45, rgb=False):
+        """Выводит FPS и p50/p95 стадий поверх кадра (BGR или RGB)"""
+        if not self.enabled:
+            return
+        lines = [f"FPS {self.fps():.1f}"]
+        lines += [f"{name}: {s['p50']:.1f}/{s['p95']:.1f} ms" for name, s in self.summary().items()]
+
+        import cv2  # OpenCV нужен только для оверлея; модуль импортируется до показа окна
+
+        color = (255, 255, 0) if rgb else (0, 255, 255)  # желтый
+        x, y = origin
+        step = int(30 * scale) + 4
+        for line in lines:
+            cv2.putText(image, line, (x, y), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 0, 0), 3)
+            cv2.putText(image, line, (x, y), cv2.FONT_HERSHEY_SIMPLEX, scale, color, 1)
+            y += step
+
+
+class MetricsExporter:
+    """Периодическая выгрузка метрик в CSV или в текстовый файл Prometheus (.prom)"""
+
+    def __init__(self, metrics, path, interval=5.0, app="app"):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.app = app
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval)
+        self.export()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+
+    def export(self):
+        summary = self.metrics.summary()
+        fps = self.metrics.fps()
+        if self.path.endswith(".prom"):
+            self._write_prometheus(summary, fps)
+        else:
+            self._append_csv(summary, fps)
+
+    def _append_csv(self, summary, fps):
+        new_file = not os.path.exists(self.path)
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+        with open(self.path, "a", encoding="utf-8") as f:
+            if new_file:
+                f.write("time,app,stage,count,p50_ms,p95_ms,p99_ms,fps\n")
+            for name, s in summary.items():
+                f.write(f"{now},{self.app},{name},{s['count']},{s['p50']:.3f},"
+                        f"{s['p95']:.3f},{s['p99']:.3f},{fps:.2f}\n")
+
+    def _write_prometheus(self, summary, fps):
+        lines = [
+            "# TYPE stage_latency_ms summary",
+        ]
+        for name, s in summary.items():
+            for key, quantile in (("p50", "0.5"), ("p95", "0.95"), ("p99", "0.99")):
+                lines.append(f'stage_latency_ms{{app="{self.app}",stage="{name}",quantile="{quantile}"}} '
+                             f"{s[key]:.3f}")
+            lines.append(f'stage_latency_ms_count{{app="{self.app}",stage="{name}"}} {s["count"]}')
+        lines += ["# TYPE frames_per_second gauge", f'frames_per_second{{app="{self.app}"}} {fps:.2f}']
+
+        # Пишем во временный файл и подменяем, чтобы сборщик не прочитал половину
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+
+
+class StartupProfiler:
+    """Замеры холодного старта: импорты, сборка моделей, первый инференс"""
+
+    def __init__(self, started=None, import_seconds=None):
+        # started - начало импортов главного модуля, т.е. практически запуск процесса
+        self.started = time.perf_counter() if started is None else started
+        self.timings = {} if import_seconds is None else {"import": import_seconds}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def measure(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.timings[name] = time.perf_counter() - started
+
+    def mark(self, name):
+        """Время от запуска до события (например, «модели готовы»)"""
+        with self._lock:
+            self.timings[name] = time.perf_counter() - self.started
+
+    def report(self):
+        with self._lock:
+            return " | ".join(f"{name}: {seconds:.2f} с" for name, seconds in self.timings.items())
+
+    def save(self, path):
+        """Дописывает замер строкой JSONL, чтобы сравнивать холодный старт между версиями"""
+        with self._lock:
+            record = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "host": platform.node(),
+                      "timings": {name: round(seconds, 4) for name, seconds in self.timings.items()}}
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def add_metrics_arguments(parser):
+    """Общие флаги метрик для обоих приложений"""
+    parser.add_argument("--metrics", action="store_true", help="замерять время стадий обработки кадра")
+    parser.add_argument("--metrics-overlay", action="store_true", help="показывать метрики поверх видео")
+    parser.add_argument("--metrics-export", metavar="PATH",
+                        help="периодически выгружать метрики в CSV или Prometheus (.prom)")
+    parser.add_argument("--metrics-interval", type=float, default=5.0, help="период выгрузки, с")
+
+
+def metrics_from_args(args, app):
+    """StageMetrics и (если задан путь) запущенный MetricsExporter по флагам командной строки"""
+    enabled = args.metrics or args.metrics_overlay or bool(args.metrics_export)
+    metrics = StageMetrics(enabled=enabled)
+    exporter = None
+    if args.metrics_export:
+        exporter = MetricsExporter(metrics, args.metrics_export, args.metrics_interval, app).start()
+    return metrics, exporter
@@ -0,0 +1,243 @@
+import argparse
+import itertools
+import json
+import sys
+import time
+
+import numpy as np
+
+# Ходы кодируются индексами MOVES; ход i бьет ход (i + 1) % 3
+MOVES = ["камень", "ножницы", "бумага"]
+MOVE_INDEX = {move: i for i, move in enumerate(MOVES)}
+# OUTCOME[первый, второй]: 1 - выиграл первый, -1 - второй, 0 - ничья
+OUTCOME = np.array([[0, 1, -1],
+                    [-1, 0, 1],
+                    [1, -1, 0]], dtype=np.int8)
+
+
+def judge_round(player_choice, computer_choice):
+    """Исход раунда для игрока: 1 - победа, -1 - поражение, 0 - ничья"""
+    return int(OUTCOME[MOVE_INDEX[player_choice], MOVE_INDEX[computer_choice]])
+
+
+def counter_move(moves):
+    """Ход, бьющий moves (работает и для массивов)"""
+    return (moves + 2) % 3
+
+
+class Strategy:
+    """Стратегия играет сразу games независимых партий: ходы - массивы (games,) индексов MOVES"""
+
+    name = "strategy"
+
+    def reset(self, games, rng):
+        self.games = games
+        self.rng = rng
+
+    def choose(self):
+        raise NotImplementedError
+
+    def observe(self, own, opponent):
+        """Ходы раунда: свои и соперника"""
+
+
+class RandomStrategy(Strategy):
+    """Равновероятные ходы; в среднем не проигрывает никому"""
+
+    name = "random"
+
+    def choose(self):
+        return self.rng.integers(0, 3, self.games)
+
+
+class BiasedStrategy(Strategy):
+    """Ходы с заданными вероятностями - модель игрока с любимым жестом"""
+
+    name = "biased"
+
+    def __init__(self, probabilities=(0.5, 0.25, 0.25)):
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        self.cumulative = np.cumsum(probabilities / probabilities.sum())
+
+    def choose(self):
+        return np.searchsorted(self.cumulative, self.rng.random(self.games), side="right").clip(0, 2)
+
+
+class CycleStrategy(Strategy):
+    """Камень, ножницы, бумага по кругу со случайного хода"""
+
+    name = "cycle"
+
+    def reset(self, games, rng):
+        super().reset(games, rng)
+        self.next = rng.integers(0, 3, games)
+
+    def choose(self):
+        return self.next
+
+    def observe(self, own, opponent):
+        self.next = (own + 1) % 3
+
+
+class FrequencyStrategy(Strategy):
+    """Бьет самый частый ход соперника; равные счетчики разбиваются случайно"""
+
+    name = "frequency"
+
+    def reset(self, games, rng):
+        super().reset(games, rng)
+        self.counts = np.zeros((games, 3), dtype=np.float64)
+        self.rows = np.arange(games)
+
+    def choose(self):
+        # Шум меньше единицы меняет только порядок равных целых счетчиков
+        predicted = (self.counts + self.rng.random((self.games, 3)) * 0.5).argmax(axis=1)
+        return counter_move(predicted)
+
+    def observe(self, own, opponent):
+        self.counts[self.rows, opponent] += 1
+
+
+class MarkovStrategy(Strategy):
+    """Цепь Маркова по истории соперника: счетчики переходов «предыдущий ход -> следующий»,
+    бьет самый вероятный следующий ход. decay < 1 забывает старые переходы"""
+
+    name = "markov"
+
+    def __init__(self, decay=1.0):
+        self.decay = decay
+
+    def reset(self, games, rng):
+        super().reset(games, rng)
+        self.transitions = np.zeros((games, 3, 3), dtype=np.float64)
+        self.rows = np.arange(games)
+        self.last = None
+
+    def choose(self):
+        if self.last is None:
+            return self.rng.integers(0, 3, self.games)
+        counts = self.transitions[self.rows, self.last]
+        predicted = (counts + self.rng.random((self.games, 3)) * 0.5).argmax(axis=1)
+        return counter_move(predicted)
+
+    def observe(self, own, opponent):
+        if self.last is not None:
+            if self.decay != 1.0:
+                self.transitions[self.rows, self.last] *= self.decay
+            self.transitions[self.rows, self.last, opponent] += 1
+        self.last = opponent
+
+
+STRATEGIES = {cls.name: cls for cls in (RandomStrategy, BiasedStrategy, CycleStrategy,
+                                         FrequencyStrategy, MarkovStrategy)}
+
+
+def make_strategy(spec):
+    """Стратегия по строке: имя или имя:параметры (biased:0.5,0.25,0.25, markov:0.9)"""
+    name, _, params = spec.partition(":")
+    if name not in STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия: {name} (есть: {', '.join(STRATEGIES)})")
+    if not params:
+        return STRATEGIES[name]()
+    values = [float(value) for value in params.split(",")]
+    if name == "biased" and len(values) != len(MOVES):
+        raise ValueError(f"{spec}: нужны {len(MOVES)} вероятности ходов")
+    try:
+        strategy = STRATEGIES[name](values) if name == "biased" else STRATEGIES[name](*values)
+    except TypeError:
+        raise ValueError(f"{spec}: неверное число параметров стратегии {name}") from None
+    strategy.name = spec  # в отчетах различаем стратегии с разными параметрами
+    return strategy
+
+
+def simulate(first, second, games=10000, rounds=1000, seed=0):
+    """games параллельных партий по rounds раундов: доли побед, ничьих и раундов в секунду"""
+    rng = np.random.default_rng(seed)
+    first.reset(games, rng)
+    second.reset(games, rng)
+    totals = np.zeros(3, dtype=np.int64)  # победы второго, ничьи, победы первого
+    scores = np.zeros(games, dtype=np.int64)
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        a = first.choose()
+        b = second.choose()
+        result = OUTCOME[a, b]
+        totals += np.bincount(result + 1, minlength=3)
+        scores += result
+        first.observe(a, b)
+        second.observe(b, a)
+    elapsed = time.perf_counter() - started
+
+    played = games * rounds
+    return {
+        "first": first.name,
+        "second": second.name,
+        "rounds": played,
+        "first_win_rate": float(totals[2] / played),
+        "second_win_rate": float(totals[0] / played),
+        "draw_rate": float(totals[1] / played),
+        # Доля партий, которые первый закончил с перевесом в счете
+        "first_match_rate": float((scores > 0).mean()),
+        "seconds": elapsed,
+        "rounds_per_s": played / elapsed if elapsed else 0.0,
+    }
+
+
+class LiveOpponent:
+    """Стратегия движка в живой игре: одна партия, ходы строками MOVES"""
+
+    def __init__(self, strategy, seed=None):
+        self.strategy = strategy if isinstance(strategy, Strategy) else make_strategy(strategy)
+        self.strategy.reset(1, np.random.default_rng(seed))
+        self.last = None
+
+    @property
+    def name(self):
+        return self.strategy.name
+
+    def choose(self):
+        self.last = self.strategy.choose()[:1].copy()
+        return MOVES[int(self.last[0])]
+
+    def observe(self, player_choice):
+        """Ход игрока в раунде, начатом последним choose()"""
+        self.strategy.observe(self.last, np.array([MOVE_INDEX[player_choice]]))
+
+
+def print_results(results):
+    print(f"{'первый':14} {'второй':14} {'победы 1':>9} {'победы 2':>9} {'ничьи':>7} {'партии 1':>9} "
+          f"{'млн раундов/с':>14}")
+    for r in results:
+        print(f"{r['first']:14} {r['second']:14} {r['first_win_rate']:>9.1%} {r['second_win_rate']:>9.1%} "
+              f"{r['draw_rate']:>7.1%} {r['first_match_rate']:>9.1%} {r['rounds_per_s'] / 1e6:>14.1f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Турнир стратегий камень-ножницы-бумага на NumPy")
+    parser.add_argument("strategies", nargs="+",
+                        help=f"стратегии ({', '.join(STRATEGIES)}), можно с параметрами: "
+                             "biased:0.5,0.25,0.25, markov:0.9; играют все пары")
+    parser.add_argument("--games", type=int, default=10000, help="параллельных партий на пару")
+    parser.add_argument("--rounds", type=int, default=1000, help="раундов в партии")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="сохранить результаты в JSON")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if len(args.strategies) < 2:
+        print("Нужно хотя бы две стратегии", file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        pairs = [(make_strategy(a), make_strategy(b)) for a, b in itertools.combinations(args.strategies, 2)]
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    results = [simulate(first, second, args.games, args.rounds, args.seed) for first, second in pairs]
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)